@@ -0,0 +1,204 @@
+"""A requests session that coalesces identical GETs and rate limits calls per endpoint.
+
+When many waits poll the same collection, each of them would otherwise GET
+`/test-suites/collection/{id}` on every tick. With this session, identical GETs that are in
+flight at the same time share one request and its parsed response, and every request first
+takes a token from the bucket configured for its endpoint, so the load on cj-backend is bounded
+no matter how many waits are in progress.
+
+A GET is only shared while it is in flight, and a write (any non-GET request) stops later GETs
+from joining in-flight GETs of a related path, so a caller never sees a snapshot taken before
+its own write.
+
+The session is meant to be shared between threads: the action, the matrix runs, the digest
+fetches and the runner service all issue requests concurrently on one session. Session
+headers must not be added or removed while requests are in flight. Logging in sends the key
+with the login request only and then replaces the existing Authorization header in one
+assignment, so the runner service can log in again while other threads keep polling.
+"""
+import json
+import os
+import re
+import threading
+import time
+import urllib.parse
+
+import requests
+
+# URL path pattern -> (requests per second, burst size).
+DEFAULT_RATE_LIMITS = {
+    r"^/test-suites/collection/": (2.0, 5),
+    r"^/test-run/": (10.0, 20),
+}
+
+
+def rate_limits_from_env() -> dict[str, tuple[float, int]]:
+    """Reads per-endpoint rate limits from CJ_RATE_LIMITS, falling back to the defaults.
+
+    CJ_RATE_LIMITS is a JSON object mapping URL path patterns to [requests_per_second, burst],
+    e.g. '{"^/test-suites/collection/": [1, 3]}'. Raises ValueError if it is malformed."""
+    rate_limits = os.getenv("CJ_RATE_LIMITS", "")
+    if not rate_limits:
+        return dict(DEFAULT_RATE_LIMITS)
+    try:
+        parsed = {
+            pattern: (float(rate), int(burst))
+            for pattern, (rate, burst) in json.loads(rate_limits).items()
+        }
+        for pattern in parsed:
+            re.compile(pattern)
+    except (json.JSONDecodeError, AttributeError, TypeError, ValueError, re.error) as e:
+        raise ValueError(f"Invalid CJ_RATE_LIMITS: {e}") from e
+    for pattern, (rate, burst) in parsed.items():
+        if not rate > 0 or burst < 1:
+            raise ValueError(
+                f"Invalid CJ_RATE_LIMITS: {pattern!r} needs a rate above 0 and a burst of at "
+                "least 1")
+    return parsed
+
+
+class TokenBucket:
+    """Thread-safe token bucket. Callers that find it empty reserve a token and sleep."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Takes one token, sleeping until it is available. Returns the seconds slept."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= 1
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if delay:
+            time.sleep(delay)
+        return delay
+
+
+class SharedResponse:
+    """A response whose body is parsed once and shared by every coalesced caller."""
+
+    def __init__(self, response: requests.Response):
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.url = response.url
+        self.text = response.text
+        self._json = None
+        self._json_error = None
+        try:
+            self._json = response.json()
+        except requests.JSONDecodeError as e:
+            self._json_error = e
+
+    def json(self):
+        """Returns the parsed body, raising the original error if it was not valid JSON."""
+        if self._json_error:
+            raise self._json_error
+        return self._json
+
+
+class _InFlight:
+    """A GET that is running."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done = threading.Event()
+        self.response: SharedResponse | None = None
+        self.error: Exception | None = None
+
+
+def _is_related_path(path: str, other: str) -> bool:
+    """Returns whether one path is the other or a sub-resource of it."""
+    return (path == other or path.startswith(other.rstrip("/") + "/") or
+            other.startswith(path.rstrip("/") + "/"))
+
+
+class BackendSession(requests.Session):
+    """Session used for all cj-backend calls. See the module docstring."""
+
+    def __init__(self, rate_limits: dict[str, tuple[float, int]] | None = None):
+        super().__init__()
+        if rate_limits is None:
+            rate_limits = rate_limits_from_env()
+        self._limiters = [
+            (re.compile(pattern), TokenBucket(rate, burst))
+            for pattern, (rate, burst) in rate_limits.items()
+        ]
+        self._lock = threading.Lock()
+        self._in_flight: dict[str, _InFlight] = {}
+        self._stats = {
+            "requests_sent": 0,
+            "requests_coalesced": 0,
+            "throttled_requests": 0,
+            "throttle_delay_seconds": 0.0,
+        }
+
+    @property
+    def stats(self) -> dict:
+        """Requests sent, requests saved by coalescing and time spent waiting on the limiter."""
+        with self._lock:
+            return dict(self._stats)
+
+    def request(self, method, url, *args, **kwargs):  # pylint: disable=arguments-differ
+        """Sends a request once the endpoint's rate limiter allows it."""
+        path = urllib.parse.urlparse(url).path
+        delay = 0.0
+        for pattern, bucket in self._limiters:
+            if pattern.search(path):
+                delay += bucket.acquire()
+                break
+        with self._lock:
+            self._stats["requests_sent"] += 1
+            if delay:
+                self._stats["throttled_requests"] += 1
+                self._stats["throttle_delay_seconds"] += delay
+        try:
+            return super().request(method, url, *args, **kwargs)
+        finally:
+            if method.upper() != "GET":
+                self._forget_in_flight(path)
+
+    def get(self, url, **kwargs):  # pylint: disable=arguments-differ
+        """Sends a GET, sharing the response with an identical GET that is still in flight."""
+        key = f"{url} {sorted(kwargs.items())!r}"
+        with self._lock:
+            in_flight = self._in_flight.get(key)
+            if in_flight:
+                self._stats["requests_coalesced"] += 1
+                is_owner = False
+            else:
+                in_flight = _InFlight(urllib.parse.urlparse(url).path)
+                self._in_flight[key] = in_flight
+                is_owner = True
+
+        if is_owner:
+            try:
+                in_flight.response = SharedResponse(super().get(url, **kwargs))
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                in_flight.error = e
+            with self._lock:
+                if self._in_flight.get(key) is in_flight:
+                    del self._in_flight[key]
+            in_flight.done.set()
+        else:
+            in_flight.done.wait()
+
+        if in_flight.error:
+            raise in_flight.error
+        return in_flight.response
+
+    def _forget_in_flight(self, path: str) -> None:
+        """Stops later GETs from joining in-flight GETs of paths related to a write. The GETs
+        themselves still complete for the callers already waiting on them."""
+        with self._lock:
+            stale = [
+                key for key, in_flight in self._in_flight.items()
+                if _is_related_path(in_flight.path, path)
+            ]
+            for key in stale:
+                del self._in_flight[key]
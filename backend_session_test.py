@@ -0,0 +1,138 @@
+"""Tests for the backend_session module."""
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import requests
+
+import backend_session
+
+
+class FakeResponse:
+    """Fake response returned by the underlying requests.Session."""
+    status_code = 200
+    headers = {}
+    url = ""
+    text = '{"status": "running"}'
+
+    def json(self):
+        """Return a fresh JSON payload on every call."""
+        return {"status": "running"}
+
+
+class BackendSessionTests(unittest.TestCase):
+    """Tests for BackendSession."""
+
+    def test_concurrent_identical_gets_share_one_request(self):
+        """Identical GETs issued while one is in flight reuse its parsed response."""
+        session = backend_session.BackendSession(rate_limits={})
+        release = threading.Event()
+        calls = []
+
+        def slow_request(self, method, url, *args, **kwargs):
+            del self, args, kwargs
+            calls.append((method, url))
+            release.wait(5)
+            return FakeResponse()
+
+        responses = []
+        with patch.object(requests.Session, "request", slow_request):
+            threads = [
+                threading.Thread(target=lambda: responses.append(session.get("https://x/a")))
+                for _ in range(5)
+            ]
+            for thread in threads:
+                thread.start()
+            time.sleep(0.1)
+            release.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(responses), 5)
+        self.assertTrue(all(response.json() is responses[0].json() for response in responses))
+        self.assertEqual(session.stats["requests_sent"], 1)
+        self.assertEqual(session.stats["requests_coalesced"], 4)
+
+    def test_different_urls_are_not_coalesced(self):
+        """GETs to different URLs each send their own request."""
+        session = backend_session.BackendSession(rate_limits={})
+        with patch.object(requests.Session, "request", return_value=FakeResponse()) as mock:
+            session.get("https://x/a")
+            session.get("https://x/b")
+            self.assertEqual(mock.call_count, 2)
+
+    def test_finished_gets_are_not_shared(self):
+        """A GET issued after an identical GET has finished sends its own request."""
+        session = backend_session.BackendSession(rate_limits={})
+        with patch.object(requests.Session, "request", return_value=FakeResponse()) as mock:
+            session.get("https://x/collection/a")
+            session.get("https://x/collection/a")
+            self.assertEqual(mock.call_count, 2)
+        self.assertEqual(session.stats["requests_coalesced"], 0)
+
+    def test_get_after_write_does_not_join_earlier_get(self):
+        """A GET issued after a write to a sub-resource does not reuse a GET started before it."""
+        session = backend_session.BackendSession(rate_limits={})
+        release = threading.Event()
+        started = threading.Event()
+        gets = []
+
+        def fake_request(self, method, url, *args, **kwargs):
+            del self, args, kwargs
+            if method == "GET":
+                gets.append(url)
+                if len(gets) == 1:
+                    started.set()
+                    release.wait(5)
+            return FakeResponse()
+
+        with patch.object(requests.Session, "request", fake_request):
+            first = threading.Thread(target=lambda: session.get("https://x/collection/a"))
+            first.start()
+            started.wait(5)
+            session.post("https://x/collection/a/run-all")
+            session.get("https://x/collection/a")
+            release.set()
+            first.join()
+
+        self.assertEqual(len(gets), 2)
+        self.assertEqual(session.stats["requests_coalesced"], 0)
+
+    def test_requests_are_throttled_per_endpoint(self):
+        """Requests beyond the burst of an endpoint wait for the bucket to refill."""
+        session = backend_session.BackendSession(rate_limits={r"^/limited": (20.0, 1)})
+        with patch.object(requests.Session, "request", return_value=FakeResponse()):
+            session.post("https://x/unlimited")
+            session.post("https://x/unlimited")
+            self.assertEqual(session.stats["throttled_requests"], 0)
+            session.post("https://x/limited")
+            session.post("https://x/limited")
+        self.assertEqual(session.stats["throttled_requests"], 1)
+        self.assertGreater(session.stats["throttle_delay_seconds"], 0.0)
+
+    def test_invalid_json_error_is_shared(self):
+        """Every caller sees the original JSON error of a non-JSON response."""
+        class TextResponse(FakeResponse):
+            """Response with a non-JSON body."""
+            def json(self):
+                raise requests.JSONDecodeError("Expecting value", "oops", 0)
+
+        session = backend_session.BackendSession(rate_limits={})
+        with patch.object(requests.Session, "request", return_value=TextResponse()):
+            with self.assertRaises(requests.JSONDecodeError):
+                session.get("https://x/a").json()
+
+    def test_rate_limits_from_env(self):
+        """Reads rate limits from CJ_RATE_LIMITS and rejects malformed values."""
+        with patch.dict("os.environ", {"CJ_RATE_LIMITS": '{"^/a": [1, 3]}'}, clear=True):
+            self.assertEqual(backend_session.rate_limits_from_env(), {"^/a": (1.0, 3)})
+        for rate_limits in ("[1]", '{"^/a": [0, 3]}', '{"^/a": [1, 0]}', '{"(": [1, 3]}'):
+            with patch.dict("os.environ", {"CJ_RATE_LIMITS": rate_limits}, clear=True):
+                with self.assertRaises(ValueError):
+                    backend_session.rate_limits_from_env()
+
+
+if __name__ == "__main__":
+    unittest.main()
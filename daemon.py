@@ -0,0 +1,479 @@
+"""Long-lived runner service shared by many CI jobs on the same host.
+
+Running `script.py` once per gate pays for the container start, imports, the TLS handshake and
+the service account login every time, only to spend most of the job in `time.sleep`. The
+service keeps one authenticated session and one poll loop alive, and CI jobs submit runs to it
+over a local HTTP API:
+
+    python daemon.py serve     # uses INPUT_SERVICE_ACCOUNT_KEY
+    python daemon.py run       # uses the usual INPUT_* variables
+
+Anyone who can reach the API can start runs with the service account. By default it is served
+on a Unix socket that only the user running the service can connect to. Serving on a localhost
+port requires a shared token in CJ_DAEMON_TOKEN, which clients send as a bearer token.
+
+API:
+    POST /runs              Submit a run. Body: {"test_id" | "test_suite_id", ...overrides}.
+    GET  /runs/<job_id>     Result of a run. `?wait=<seconds>` blocks until it is done.
+    GET  /health            Number of runs still being waited on and backend session stats.
+"""
+import argparse
+import hmac
+import http.client
+import http.server
+import json
+import os
+import socket
+import socketserver
+import stat
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+
+import requests
+
+import backend_session
+import runner
+import schema_validation
+
+RETAIN_FINISHED_SECONDS = 60 * 60
+CLIENT_WAIT_SECONDS = 30
+
+
+def default_socket_path() -> str:
+    """Returns the socket path used when none is given, in the user's runtime directory."""
+    return os.path.join(os.getenv("XDG_RUNTIME_DIR") or os.path.expanduser("~"), "cj-action.sock")
+
+
+class Job:
+    """A submitted run that the service waits on."""
+
+    def __init__(self, test_id: str, collection_id: str, wait_timeout_seconds: int):
+        self.job_id = uuid.uuid4().hex
+        self.test_id = test_id
+        self.collection_id = collection_id
+        self.deadline = time.monotonic() + wait_timeout_seconds
+        self.test_run_id = None
+        self.created_at = None
+        self.run_states: runner.RunStateTable | None = None
+        self.finished_at = None
+        self.result: tuple[bool, str, list[str]] | None = None
+        self.done = threading.Event()
+
+    def finish(self, result: tuple[bool, str, list[str]]) -> None:
+        """Stores the result and wakes up everyone waiting on the job."""
+        self.result = result
+        self.finished_at = time.monotonic()
+        self.done.set()
+
+    def to_dict(self) -> dict:
+        """Returns the JSON representation served by the API."""
+        job = {"job_id": self.job_id, "done": self.done.is_set()}
+        if self.result:
+            success, msg, failed_run_ids = self.result
+            job.update({"success": success, "message": msg, "failed_run_ids": failed_run_ids})
+        return job
+
+
+class RunService:
+    """Starts runs on a single shared session and resolves them from a single poll loop."""
+
+    def __init__(
+            self,
+            session: requests.Session,
+            service_account_key: str,
+            poll_every_seconds: float = 10.0
+        ):
+        self._session = session
+        self._service_account_key = service_account_key
+        self._poll_every_seconds = poll_every_seconds
+        # The session is shared by the poll loop and the request handler threads (see
+        # backend_session). Only logging in, which replaces the session headers, is serialized.
+        self._login_lock = threading.Lock()
+        self._jobs_lock = threading.Lock()
+        self._jobs: dict[str, Job] = {}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._poll_loop, daemon=True)
+        session.hooks["response"].append(self._relogin_on_unauthorized)
+
+    def start(self) -> None:
+        """Logs in the service account and starts the poll loop."""
+        with self._login_lock:
+            if not runner.login_service_account(self._session, self._service_account_key):
+                raise RuntimeError("Failed to login service account.")
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the poll loop."""
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _relogin_on_unauthorized(self, response: requests.Response, **kwargs):
+        """Response hook that logs in again when the session token was rejected, and resends
+        the request once with the new token."""
+        request = response.request
+        if (response.status_code != 401 or getattr(request, "is_retry", False) or
+                request.url.endswith("/auth/login_service_account")):
+            return response
+        with self._login_lock:
+            # Another thread may have logged in again while this request was in flight.
+            if self._session.headers.get("Authorization") == request.headers.get("Authorization"):
+                if not runner.login_service_account(self._session, self._service_account_key):
+                    print("Warning: Failed to login service account again.")
+                    return response
+            retry = request.copy()
+            retry.headers["Authorization"] = self._session.headers["Authorization"]
+        retry.is_retry = True
+        return self._session.send(retry, **kwargs)
+
+    def submit(self, request: dict) -> Job:
+        """Starts the requested run and registers it with the poll loop.
+
+        Raises ValueError for malformed requests. Failures to start the run are reported as the
+        job result, the same way `runner.run` reports them."""
+        test_id = request.get("test_id", "")
+        collection_id = request.get("test_suite_id", "")
+        if not test_id and not collection_id:
+            raise ValueError("Either test_id or test_suite_id should be provided.")
+        wait_timeout_seconds = int(request.get("wait_timeout_seconds", 300))
+        if not 30 <= wait_timeout_seconds <= 900:
+            raise ValueError("WAIT_TIMEOUT_SECONDS must be between 30 and 900 seconds")
+        run_settings = runner.create_run_settings(
+            website_url_override=request.get("website_url_override", ""),
+            params_override=request.get("params_override", ""),
+            browser_type_override=request.get("browser_type_override", ""),
+        )
+        schema_validation.validate_run_settings(run_settings, single_test=bool(test_id))
+
+        job = Job(test_id, "" if test_id else collection_id, wait_timeout_seconds)
+        with self._jobs_lock:
+            self._jobs[job.job_id] = job
+
+        try:
+            if test_id:
+                job.test_run_id, error = runner.start_single_test_run(
+                    self._session, test_id, run_settings)
+            else:
+                job.created_at, error = runner.start_bulk_test_run(
+                    self._session, collection_id, run_settings)
+                if job.created_at:
+                    job.run_states = runner.RunStateTable(collection_id, job.created_at)
+            if error:
+                job.finish((False, error, []))
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            job.finish((False, f"Failed: {e}", []))
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        """Returns the job with the given ID, if it is known."""
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def pending_count(self) -> int:
+        """Returns the number of jobs that are still being waited on."""
+        with self._jobs_lock:
+            return sum(1 for job in self._jobs.values() if not job.done.is_set())
+
+    def stats(self) -> dict:
+        """Returns the coalescing and rate limiting stats of the session, if it keeps any."""
+        return getattr(self._session, "stats", {})
+
+    def _poll_loop(self) -> None:
+        while not self._stopped.is_set():
+            self.poll_once()
+            self._stopped.wait(self._poll_every_seconds)
+
+    def poll_once(self) -> None:
+        """Fetches the status of all pending runs once and resolves the finished ones.
+
+        Suite runs on the same collection share a single fetch per tick."""
+        now = time.monotonic()
+        single_jobs = []
+        jobs_by_collection: dict[str, list[Job]] = {}
+        with self._jobs_lock:
+            for job_id, job in list(self._jobs.items()):
+                if job.done.is_set():
+                    if now - job.finished_at > RETAIN_FINISHED_SECONDS:
+                        del self._jobs[job_id]
+                    continue
+                if job.test_run_id:
+                    single_jobs.append(job)
+                elif job.created_at:
+                    jobs_by_collection.setdefault(job.collection_id, []).append(job)
+
+        for job in single_jobs:
+            try:
+                self._poll_single_job(job)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                job.finish((False, f"Failed: {e}", []))
+        for collection_id, jobs in jobs_by_collection.items():
+            try:
+                self._poll_collection_jobs(collection_id, jobs)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                for job in jobs:
+                    job.finish((False, f"Failed: {e}", []))
+
+        for job in single_jobs:
+            if not job.done.is_set() and now >= job.deadline:
+                job.finish(runner.single_test_run_result(job.test_run_id, None))
+        for jobs in jobs_by_collection.values():
+            for job in jobs:
+                if not job.done.is_set() and now >= job.deadline:
+                    job.finish((False, "Timed out waiting for test suite result.", []))
+
+    def _poll_single_job(self, job: Job) -> None:
+        response = self._session.get(f"{runner.BACKEND_URL}/test-run/{job.test_run_id}")
+        if response.status_code != 200:
+            job.finish(runner.single_test_run_result(job.test_run_id, None))
+            return
+        try:
+            run_status = response.json()
+        except requests.JSONDecodeError:
+            job.finish(runner.single_test_run_result(job.test_run_id, None))
+            return
+        if run_status.get("status") in {"passed", "failed"}:
+            job.finish(runner.single_test_run_result(job.test_run_id, run_status))
+
+    def _poll_collection_jobs(self, collection_id: str, jobs: list[Job]) -> None:
+        response = self._session.get(
+            f"{runner.BACKEND_URL}/test-suites/collection/{collection_id}")
+        if response.status_code != 200:
+            for job in jobs:
+                job.finish((False, "Error fetching test suite status.", []))
+            return
+        try:
+            run_status_json = response.json()
+        except requests.JSONDecodeError:
+            return
+        for job in jobs:
+            try:
+                is_finished, group_status = job.run_states.update(run_status_json)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                job.finish((False, f"Failed: {e}", []))
+                continue
+            if is_finished:
+                job.finish(runner.bulk_test_run_result(group_status))
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    """Serves the run API for the RunService attached to the server."""
+
+    def address_string(self) -> str:
+        # Unix socket clients have no address.
+        return self.client_address[0] if self.client_address else "unix"
+
+    def _is_authorized(self) -> bool:
+        """Checks the bearer token of servers that require one, and answers 401 otherwise."""
+        token = self.server.token
+        if not token or hmac.compare_digest(
+                self.headers.get("Authorization", ""), f"Bearer {token}"):
+            return True
+        self._send_json(401, {"error": "Unauthorized"})
+        return False
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Submits a run."""
+        if not self._is_authorized():
+            return
+        if self.path != "/runs":
+            self._send_json(404, {"error": "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            job = self.server.service.submit(request)
+        except (ValueError, TypeError, AttributeError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        self._send_json(202, job.to_dict())
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Returns the health of the service or the result of a run."""
+        if not self._is_authorized():
+            return
+        url = urllib.parse.urlparse(self.path)
+        service = self.server.service
+        if url.path == "/health":
+            self._send_json(200, {"pending": service.pending_count(), **service.stats()})
+            return
+        if not url.path.startswith("/runs/"):
+            self._send_json(404, {"error": "Not found"})
+            return
+        job = service.get(url.path.removeprefix("/runs/"))
+        if not job:
+            self._send_json(404, {"error": "Unknown job"})
+            return
+        query = urllib.parse.parse_qs(url.query)
+        try:
+            wait_seconds = float(query.get("wait", ["0"])[0])
+        except ValueError:
+            self._send_json(400, {"error": "wait must be a number"})
+            return
+        job.done.wait(min(max(wait_seconds, 0.0), 300.0))
+        self._send_json(200, job.to_dict())
+
+
+class _TCPServer(http.server.ThreadingHTTPServer):
+    service: RunService
+    token: str
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    service: RunService
+    token: str
+
+
+def create_server(
+        service: RunService,
+        socket_path: str = "",
+        port: int | None = None,
+        token: str = ""
+    ) -> socketserver.BaseServer:
+    """Creates the API server on a Unix socket that only the current user can connect to, or,
+    if a port is given, on localhost with every request required to carry the token.
+
+    Raises ValueError if a TCP server has no token or the socket path is not a socket."""
+    if port is not None:
+        if not token:
+            raise ValueError("CJ_DAEMON_TOKEN is required to serve on a TCP port.")
+        server = _TCPServer(("127.0.0.1", port), _RequestHandler)
+    else:
+        socket_path = socket_path or default_socket_path()
+        if os.path.lexists(socket_path):
+            if not stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+                raise ValueError(f"{socket_path} exists and is not a socket.")
+            os.unlink(socket_path)
+        # Bind with mode 0600, so there is no window in which others can connect.
+        previous_umask = os.umask(0o177)
+        try:
+            server = _UnixServer(socket_path, _RequestHandler)
+        finally:
+            os.umask(previous_umask)
+    server.service = service
+    server.token = token
+    return server
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix socket."""
+
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self._socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._socket_path)
+
+
+def _request(
+        method: str,
+        path: str,
+        socket_path: str,
+        port: int | None,
+        token: str,
+        body: dict | None = None
+    ) -> tuple[int, dict]:
+    """Sends a request to the service and returns the status code and JSON response."""
+    timeout = CLIENT_WAIT_SECONDS + 30
+    if port is None:
+        connection = _UnixHTTPConnection(socket_path or default_socket_path(), timeout)
+    else:
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    try:
+        payload = json.dumps(body).encode("utf-8") if body is not None else None
+        connection.request(method, path, body=payload, headers=headers)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read() or b"{}")
+    finally:
+        connection.close()
+
+
+def submit_and_wait(
+        socket_path: str = "",
+        port: int | None = None,
+        token: str = ""
+    ) -> tuple[bool, str, list[str]]:
+    """Submits a run built from the INPUT_* environment variables and waits for its result."""
+    request = {
+        "test_id": os.getenv("INPUT_TEST_ID", ""),
+        "test_suite_id": os.getenv("INPUT_TEST_SUITE_ID", ""),
+        "wait_timeout_seconds": os.getenv("INPUT_WAIT_TIMEOUT_SECONDS", "300"),
+        "website_url_override": os.getenv("INPUT_WEBSITE_URL_OVERRIDE", ""),
+        "params_override": os.getenv("INPUT_PARAMS_OVERRIDE", ""),
+        "browser_type_override": os.getenv("INPUT_BROWSER_TYPE_OVERRIDE", ""),
+    }
+    status, job = _request("POST", "/runs", socket_path, port, token, request)
+    if status != 202:
+        return False, f"Failed: {job.get('error')}", []
+    while not job.get("done"):
+        status, job = _request(
+            "GET", f"/runs/{job['job_id']}?wait={CLIENT_WAIT_SECONDS}", socket_path, port,
+            token)
+        if status != 200:
+            return False, f"Failed: {job.get('error')}", []
+    return job["success"], job["message"], job["failed_run_ids"]
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Command line entry point for both the service and its client."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command in ("serve", "run"):
+        subparser = subparsers.add_parser(command)
+        subparser.add_argument("--socket", default=os.getenv("CJ_DAEMON_SOCKET", ""))
+        subparser.add_argument("--port", type=int, default=os.getenv("CJ_DAEMON_PORT"))
+    args = parser.parse_args(argv)
+    token = os.getenv("CJ_DAEMON_TOKEN", "")
+
+    if args.command == "run":
+        success, output_msg, _ = submit_and_wait(args.socket, args.port, token)
+        if not success:
+            sys.exit(output_msg)
+        print(output_msg)
+        return
+
+    service_account_key = os.getenv("INPUT_SERVICE_ACCOUNT_KEY", "")
+    if not service_account_key:
+        sys.exit("Failed: Service account key should be provided.")
+    if args.port is not None and not token:
+        sys.exit("Failed: CJ_DAEMON_TOKEN is required to serve on a TCP port.")
+    try:
+        session = backend_session.BackendSession()
+    except ValueError as e:  # Invalid CJ_RATE_LIMITS.
+        sys.exit(f"Failed: {e}")
+    with session:
+        service = RunService(session, service_account_key)
+        service.start()
+        try:
+            server = create_server(service, args.socket, args.port, token)
+        except ValueError as e:
+            service.stop()
+            sys.exit(f"Failed: {e}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            service.stop()
+
+
+if __name__ == "__main__":
+    main()
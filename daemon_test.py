@@ -0,0 +1,198 @@
+"""Tests for the daemon module."""
+import os
+import stat
+import tempfile
+import threading
+import unittest
+from unittest.mock import Mock, patch
+
+import requests
+
+import daemon
+import runner
+
+
+class FakeResponse:
+    """Fake backend response."""
+
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self.payload = payload
+
+    def json(self):
+        """Return the JSON payload."""
+        return self.payload
+
+
+class FakeSession:
+    """Fake session for a backend with one collection and one single test."""
+
+    def __init__(self):
+        self.gets = []
+        self.collection_status = "running"
+        self.hooks = {"response": []}
+
+    def post(self, url, json=None):  # pylint: disable=redefined-outer-name
+        """Start runs."""
+        del json
+        if url.endswith("/run-all"):
+            return FakeResponse(200, "2025-01-01T00:00:00.000Z")
+        return FakeResponse(201, "test-run-id")
+
+    def get(self, url):
+        """Return run statuses."""
+        self.gets.append(url)
+        if url.endswith("/test-run/test-run-id"):
+            return FakeResponse(200, {"status": "passed"})
+        return FakeResponse(200, {
+            "test_suite_id": "project-id",
+            "linked_runs": [{
+                "_id": "test-run-id",
+                "status": self.collection_status,
+                "created_at": "2025-01-01T00:00:00Z",
+            }],
+        })
+
+
+class RunServiceTests(unittest.TestCase):
+    """Tests for RunService."""
+
+    def setUp(self):
+        self.session = FakeSession()
+        self.service = daemon.RunService(self.session, "key", poll_every_seconds=0.01)
+        with patch.object(runner, "login_service_account", return_value=True):
+            with patch.object(self.service, "_thread", threading.Thread(target=lambda: None)):
+                self.service.start()
+
+    def test_suite_jobs_on_same_collection_share_one_fetch(self):
+        """Waits on the same collection are resolved from one GET per tick."""
+        jobs = [self.service.submit({"test_suite_id": "collection-id"}) for _ in range(3)]
+        self.service.poll_once()
+        self.assertEqual(len(self.session.gets), 1)
+        self.assertEqual(self.service.pending_count(), 3)
+
+        self.session.collection_status = "passed"
+        self.service.poll_once()
+        self.assertEqual(len(self.session.gets), 2)
+        for job in jobs:
+            self.assertTrue(job.done.is_set())
+            self.assertTrue(job.result[0])
+            self.assertIn("1 passed, 0 failed", job.result[1])
+
+    def test_single_job_resolves(self):
+        """Resolves a single test run once its status is final."""
+        job = self.service.submit({"test_id": "test-case-id"})
+        self.service.poll_once()
+        self.assertEqual(job.to_dict()["message"], "Test passed!")
+
+    def test_one_failing_job_does_not_fail_others_on_collection(self):
+        """An error while updating one job only fails that job."""
+        jobs = [self.service.submit({"test_suite_id": "collection-id"}) for _ in range(2)]
+        jobs[0].run_states = Mock(update=Mock(side_effect=ValueError("boom")))
+        self.service.poll_once()
+        self.assertEqual(jobs[0].result, (False, "Failed: boom", []))
+        self.assertFalse(jobs[1].done.is_set())
+
+    def test_invalid_request_is_rejected(self):
+        """Rejects requests without a test or suite ID before calling the backend."""
+        with self.assertRaises(ValueError):
+            self.service.submit({})
+        self.assertEqual(self.session.gets, [])
+
+
+class ReloginTests(unittest.TestCase):
+    """Tests for logging in again when the session token is rejected."""
+
+    @staticmethod
+    def _response(session, status_code):
+        """Builds a response to a GET sent with the session's current headers."""
+        response = requests.Response()
+        response.status_code = status_code
+        response.request = session.prepare_request(
+            requests.Request("GET", f"{runner.BACKEND_URL}/test-run/run-id"))
+        return response
+
+    def test_unauthorized_response_logs_in_again_and_retries(self):
+        """A 401 triggers a new login and the request is resent with the new token."""
+        session = requests.Session()
+        session.headers["Authorization"] = "Bearer expired"
+        service = daemon.RunService(session, "key")
+
+        def fake_login(login_session, key):
+            del key
+            login_session.headers["Authorization"] = "Bearer fresh"
+            return True
+
+        with patch.object(runner, "login_service_account", side_effect=fake_login):
+            with patch.object(session, "send", return_value=self._response(session, 200)) as send:
+                response = service._relogin_on_unauthorized(  # pylint: disable=protected-access
+                    self._response(session, 401))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(send.call_args[0][0].headers["Authorization"], "Bearer fresh")
+
+    def test_failed_login_keeps_previous_token(self):
+        """A failed login restores the session headers instead of leaving the raw key."""
+        session = requests.Session()
+        session.headers["Authorization"] = "Bearer expired"
+        service = daemon.RunService(session, "raw-key")
+        failed_login = requests.Response()
+        failed_login.status_code = 500
+        with patch.object(session, "post", return_value=failed_login):
+            with patch.object(session, "send") as send:
+                response = service._relogin_on_unauthorized(  # pylint: disable=protected-access
+                    self._response(session, 401))
+        self.assertEqual(response.status_code, 401)
+        send.assert_not_called()
+        self.assertEqual(session.headers["Authorization"], "Bearer expired")
+
+
+class ServerTests(unittest.TestCase):
+    """End-to-end tests of the HTTP API and the client."""
+
+    def setUp(self):
+        self.service = daemon.RunService(FakeSession(), "key", poll_every_seconds=0.01)
+        with patch.object(runner, "login_service_account", return_value=True):
+            self.service.start()
+        self.addCleanup(self.service.stop)
+
+    def _serve(self, server):
+        """Serves requests in the background until the test ends."""
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+    def test_client_round_trip_on_unix_socket(self):
+        """A client submits a run over the user-only socket and receives its result."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            socket_path = os.path.join(tmp_dir, "cj.sock")
+            self._serve(daemon.create_server(self.service, socket_path))
+            self.assertEqual(stat.S_IMODE(os.stat(socket_path).st_mode), 0o600)
+            with patch.dict("os.environ", {"INPUT_TEST_ID": "test-case-id"}, clear=True):
+                result = daemon.submit_and_wait(socket_path)
+        self.assertEqual(result, (True, "Test passed!", []))
+
+    def test_tcp_requires_token(self):
+        """A TCP server needs a token and rejects requests without it."""
+        with self.assertRaises(ValueError):
+            daemon.create_server(self.service, port=0)
+        server = daemon.create_server(self.service, port=0, token="secret")
+        self._serve(server)
+        port = server.server_address[1]
+        with patch.dict("os.environ", {"INPUT_TEST_ID": "test-case-id"}, clear=True):
+            self.assertEqual(
+                daemon.submit_and_wait(port=port, token="wrong"),
+                (False, "Failed: Unauthorized", []))
+            self.assertEqual(
+                daemon.submit_and_wait(port=port, token="secret"), (True, "Test passed!", []))
+
+    def test_does_not_replace_other_files(self):
+        """A socket path that holds a regular file is left alone."""
+        with tempfile.NamedTemporaryFile() as existing:
+            with self.assertRaises(ValueError):
+                daemon.create_server(self.service, existing.name)
+            self.assertTrue(os.path.exists(existing.name))
+
+
+if __name__ == "__main__":
+    unittest.main()
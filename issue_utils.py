@@ -1,9 +1,12 @@
 """Utilities for creating issues from test run failures."""
 import os
+import re
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 
+import profiling
 from runner import BACKEND_URL
 
 
@@ -18,6 +21,19 @@ def fetch_run_details(session: requests.Session, test_run_id: str) -> dict | Non
         return None
 
 
+def fetch_runs_details(
+    session: requests.Session,
+    test_run_ids: list[str],
+    max_workers: int = 8,
+) -> dict[str, dict | None]:
+    """Fetches details for several test runs in parallel, keyed by run ID."""
+    if not test_run_ids:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(test_run_ids))) as executor:
+        results = executor.map(lambda run_id: fetch_run_details(session, run_id), test_run_ids)
+        return dict(zip(test_run_ids, results))
+
+
 def build_steps_markdown(steps: list) -> str:
     """Returns a markdown list of executed steps."""
     if not steps:
@@ -90,6 +106,75 @@ def build_issue_body(
 *This issue was automatically created by the Critical Journey action.*"""
 
 
+def _escape_table_cell(value: str) -> str:
+    """Makes a value safe to place inside a markdown table cell."""
+    return " ".join(str(value).split()).replace("|", "\\|")
+
+
+# A digest table row and the collapsed steps of a run, with the run ID as the first group.
+_DIGEST_ROW = re.compile(r"^\| `[^`\n]*` \| \[`([^`\n]+)`\].*$", re.M)
+_DIGEST_SECTION = re.compile(
+    r"^<details>\n<summary>Steps for run <code>([^<\n]+)</code></summary>\n.*?^</details>$",
+    re.M | re.S)
+
+
+def build_digest_body(
+    runs: list[tuple[str, dict]],
+    commit_sha: str,
+    branch: str,
+    workflow_url: str,
+    previous_body: str = "",
+) -> str:
+    """Assembles the markdown body for a digest issue covering several failed runs. Runs listed
+    in `previous_body`, the current body of the issue, are kept unless they are reported again."""
+    reported = {test_run_id for test_run_id, _ in runs}
+    rows = [
+        match.group(0) for match in _DIGEST_ROW.finditer(previous_body)
+        if match.group(1) not in reported
+    ]
+    sections = [
+        match.group(0) for match in _DIGEST_SECTION.finditer(previous_body)
+        if match.group(1) not in reported
+    ]
+    for test_run_id, run_details in runs:
+        test_id = run_details.get("test_case_id", "")
+        details_url = (
+            f"https://app.foreai.co/test-cases/details/{test_id}/runs?run={test_run_id}"
+        )
+        failing_step = run_details.get("failing_step_index")
+        failing_step_str = str(failing_step + 1) if failing_step is not None else "N/A"
+        error = _escape_table_cell(run_details.get("user_friendly_error") or "N/A")
+        rows.append(
+            f"| `{test_id}` | [`{test_run_id}`]({details_url}) | {failing_step_str} | {error} |"
+        )
+        sections.append(
+            f"<details>\n<summary>Steps for run <code>{test_run_id}</code></summary>\n\n"
+            f"{build_steps_markdown(run_details.get('steps', []))}\n\n</details>"
+        )
+
+    table = "\n".join(rows)
+    steps = "\n\n".join(sections)
+    return f"""## Test Failure Digest
+
+**Failed journeys:** {len(rows)}
+
+| Test ID | Run | Failing Step | Error |
+|---------|-----|--------------|-------|
+{table}
+
+### Workflow Details
+
+- **Commit:** {commit_sha}
+- **Branch:** {branch}
+- **Workflow Run:** {workflow_url}
+
+### Steps Executed
+
+{steps}
+---
+*This issue was automatically created by the Critical Journey action.*"""
+
+
 def _prepare_issue_content(
     session: requests.Session,
     test_run_id: str,
@@ -105,18 +190,75 @@ def _prepare_issue_content(
     test_id = run_details.get("test_case_id", "")
     short_sha = commit_sha[:7] if commit_sha else ""
     title = f"Test Failed: {run_details.get('user_friendly_error', 'Test execution failed')}"
-    body = build_issue_body(
-        run_details=run_details,
-        test_run_id=test_run_id,
-        test_id=test_id,
-        commit_sha=short_sha,
-        branch=branch,
-        workflow_url=workflow_url,
-        steps_md=build_steps_markdown(run_details.get("steps", [])),
-    )
+    with profiling.phase("render"):
+        body = build_issue_body(
+            run_details=run_details,
+            test_run_id=test_run_id,
+            test_id=test_id,
+            commit_sha=short_sha,
+            branch=branch,
+            workflow_url=workflow_url,
+            steps_md=build_steps_markdown(run_details.get("steps", [])),
+        )
     return title, body
 
 
+def _digest_title(pipeline_id: str, commit_sha: str, key_parts: list[str]) -> str:
+    """Returns the title that identifies the digest issue of one workflow run, job and step.
+    Every action step reports into its own issue, so steps do not overwrite each other."""
+    title = f"Test Failures: Critical Journey run {pipeline_id or commit_sha[:7]}"
+    for part in key_parts:
+        if part:
+            title += f" / {part}"
+    return title
+
+
+def _run_target() -> str:
+    """Returns the test or suite ID this step runs."""
+    return os.getenv("INPUT_TEST_ID") or os.getenv("INPUT_TEST_SUITE_ID", "")
+
+
+def _prepare_digest_body(
+    session: requests.Session,
+    test_run_ids: list[str],
+    workflow_url: str,
+    commit_sha: str,
+    branch: str,
+    previous_body: str,
+) -> str | None:
+    """Fetches details for all failed runs and builds the digest body, keeping the runs that
+    other writers already listed in `previous_body`. Returns None when no run details could be
+    fetched."""
+    details_by_id = fetch_runs_details(session, test_run_ids)
+    runs = []
+    for test_run_id in test_run_ids:
+        run_details = details_by_id.get(test_run_id)
+        if not run_details:
+            print(f"Warning: Could not fetch details for run {test_run_id}; "
+                  "leaving it out of the digest.")
+            continue
+        runs.append((test_run_id, run_details))
+    if not runs:
+        print("Warning: Could not fetch details for any failed run; skipping issue creation.")
+        return None
+    with profiling.phase("render"):
+        return build_digest_body(
+            runs=runs,
+            commit_sha=commit_sha[:7] if commit_sha else "",
+            branch=branch,
+            workflow_url=workflow_url,
+            previous_body=previous_body,
+        )
+
+
+def _get_github_headers(github_token: str) -> dict:
+    return {
+        "Authorization": f"Bearer {github_token}",
+        "Accept": "application/vnd.github+json",
+        "X-GitHub-Api-Version": "2022-11-28",
+    }
+
+
 def _post_github_issue(
     github_token: str,
     github_repository: str,
@@ -126,11 +268,7 @@ def _post_github_issue(
     """Posts a new issue to the GitHub API and prints the result."""
     response = requests.post(
         f"https://api.github.com/repos/{github_repository}/issues",
-        headers={
-            "Authorization": f"Bearer {github_token}",
-            "Accept": "application/vnd.github+json",
-            "X-GitHub-Api-Version": "2022-11-28",
-        },
+        headers=_get_github_headers(github_token),
         json={
             "title": title,
             "body": body,
@@ -144,6 +282,51 @@ def _post_github_issue(
         print(f"Warning: Failed to create issue ({response.status_code}): {response.text}")
 
 
+def _find_github_issue(
+    github_token: str,
+    github_repository: str,
+    title: str,
+) -> dict | None:
+    """Returns the open issue with the given title, or an empty dict if there is none. Returns
+    None if the search failed, e.g. on the search API's rate limit, as a new issue might then
+    duplicate the existing one."""
+    quoted_title = title.replace('"', "")
+    response = requests.get(
+        "https://api.github.com/search/issues",
+        headers=_get_github_headers(github_token),
+        params={
+            "q": f'repo:{github_repository} is:issue is:open label:test-failure label:foreai '
+                 f'in:title "{quoted_title}"',
+        },
+        timeout=30,
+    )
+    if response.status_code != 200:
+        print(f"Warning: Failed to search issues ({response.status_code}): {response.text}; "
+              "skipping issue creation.")
+        return None
+    return next(
+        (issue for issue in response.json().get("items", []) if issue.get("title") == title), {})
+
+
+def _update_github_issue(
+    github_token: str,
+    github_repository: str,
+    issue_number: int,
+    body: str,
+) -> None:
+    """Replaces the body of an existing issue and prints the result."""
+    response = requests.patch(
+        f"https://api.github.com/repos/{github_repository}/issues/{issue_number}",
+        headers=_get_github_headers(github_token),
+        json={"body": body},
+        timeout=30,
+    )
+    if response.status_code == 200:
+        print(f"Issue updated: {response.json().get('html_url')}")
+    else:
+        print(f"Warning: Failed to update issue ({response.status_code}): {response.text}")
+
+
 def _post_gitlab_issue(
     gitlab_token: str,
     gitlab_url: str,
@@ -172,6 +355,61 @@ def _post_gitlab_issue(
         print(f"Warning: Failed to create GitLab issue ({response.status_code}): {response.text}")
 
 
+def _get_gitlab_headers(gitlab_token: str) -> dict:
+    return {
+        "PRIVATE-TOKEN": gitlab_token,
+        "Content-Type": "application/json",
+    }
+
+
+def _find_gitlab_issue(
+    gitlab_token: str,
+    gitlab_url: str,
+    project_id: str,
+    title: str,
+) -> dict | None:
+    """Returns the open GitLab issue with the given title, or an empty dict if there is none.
+    Returns None if the search failed."""
+    encoded_project_id = urllib.parse.quote(project_id, safe="")
+    response = requests.get(
+        f"{gitlab_url}/api/v4/projects/{encoded_project_id}/issues",
+        headers=_get_gitlab_headers(gitlab_token),
+        params={
+            "labels": "test-failure,foreai",
+            "state": "opened",
+            "search": title,
+            "in": "title",
+        },
+        timeout=30,
+    )
+    if response.status_code != 200:
+        print(f"Warning: Failed to search GitLab issues ({response.status_code}): "
+              f"{response.text}; skipping issue creation.")
+        return None
+    return next((issue for issue in response.json() if issue.get("title") == title), {})
+
+
+def _update_gitlab_issue(
+    gitlab_token: str,
+    gitlab_url: str,
+    project_id: str,
+    issue_iid: int,
+    body: str,
+) -> None:
+    """Replaces the description of an existing GitLab issue and prints the result."""
+    encoded_project_id = urllib.parse.quote(project_id, safe="")
+    response = requests.put(
+        f"{gitlab_url}/api/v4/projects/{encoded_project_id}/issues/{issue_iid}",
+        headers=_get_gitlab_headers(gitlab_token),
+        json={"description": body},
+        timeout=30,
+    )
+    if response.status_code == 200:
+        print(f"GitLab issue updated: {response.json().get('web_url')}")
+    else:
+        print(f"Warning: Failed to update GitLab issue ({response.status_code}): {response.text}")
+
+
 def create_github_issue_for_run(session: requests.Session, test_run_id: str) -> None:
     """Creates a GitHub issue with full details of a failed test run."""
     github_token = os.getenv("GITHUB_TOKEN", "")
@@ -222,3 +460,76 @@ def create_gitlab_issue_for_run(session: requests.Session, test_run_id: str) ->
         return
     title, body = content
     _post_gitlab_issue(gitlab_token, gitlab_url, project_id, title, body)
+
+
+def create_github_digest_issue(session: requests.Session, test_run_ids: list[str]) -> None:
+    """Creates or updates a single GitHub issue summarising all failed runs of this workflow job."""
+    github_token = os.getenv("GITHUB_TOKEN", "")
+    github_repository = os.getenv("GITHUB_REPOSITORY", "")
+    github_server_url = os.getenv("GITHUB_SERVER_URL", "https://github.com")
+    github_run_id = os.getenv("GITHUB_RUN_ID", "")
+    github_sha = os.getenv("GITHUB_SHA", "")
+    github_ref = os.getenv("GITHUB_REF", "")
+
+    if not github_token:
+        print("Warning: GITHUB_TOKEN is not set; cannot create issue.")
+        return
+    if not github_repository:
+        print("Warning: GITHUB_REPOSITORY is not set; cannot create issue.")
+        return
+
+    run_url = (
+        f"{github_server_url}/{github_repository}/actions/runs/{github_run_id}"
+        if github_run_id else ""
+    )
+    branch = github_ref.replace("refs/heads/", "") if github_ref else ""
+
+    # GITHUB_ACTION names the step, so two steps of one job report into separate issues.
+    # Matrix legs of a job share the key; their runs are merged into the issue body instead.
+    title = _digest_title(github_run_id, github_sha, [
+        os.getenv("GITHUB_JOB", ""), os.getenv("GITHUB_ACTION", ""), _run_target()])
+    existing = _find_github_issue(github_token, github_repository, title)
+    if existing is None:
+        return
+    body = _prepare_digest_body(
+        session, test_run_ids, run_url, github_sha, branch, existing.get("body") or "")
+    if not body:
+        return
+    if existing:
+        _update_github_issue(github_token, github_repository, existing["number"], body)
+    else:
+        _post_github_issue(github_token, github_repository, title, body)
+
+
+def create_gitlab_digest_issue(session: requests.Session, test_run_ids: list[str]) -> None:
+    """Creates or updates a single GitLab issue summarising all failed runs of this pipeline job."""
+    gitlab_token = os.getenv("INPUT_GITLAB_TOKEN", "")
+    project_id = os.getenv("INPUT_GITLAB_PROJECT_ID", "")
+    gitlab_url = os.getenv("CI_SERVER_URL", "https://gitlab.com").rstrip("/")
+    pipeline_id = os.getenv("CI_PIPELINE_ID", "")
+    pipeline_url = os.getenv("CI_PIPELINE_URL", "")
+    commit_sha = os.getenv("CI_COMMIT_SHA", "")
+    branch = os.getenv("CI_COMMIT_REF_NAME", "")
+
+    if not gitlab_token:
+        print("Warning: INPUT_GITLAB_TOKEN is not set; cannot create GitLab issue.")
+        return
+    if not project_id:
+        print("Warning: INPUT_GITLAB_PROJECT_ID is not set; cannot create GitLab issue.")
+        return
+
+    # CI_JOB_NAME includes the values of `parallel:matrix` jobs, so each leg has its own issue.
+    title = _digest_title(
+        pipeline_id, commit_sha, [os.getenv("CI_JOB_NAME", ""), _run_target()])
+    existing = _find_gitlab_issue(gitlab_token, gitlab_url, project_id, title)
+    if existing is None:
+        return
+    body = _prepare_digest_body(
+        session, test_run_ids, pipeline_url, commit_sha, branch,
+        existing.get("description") or "")
+    if not body:
+        return
+    if existing:
+        _update_gitlab_issue(gitlab_token, gitlab_url, project_id, existing["iid"], body)
+    else:
+        _post_gitlab_issue(gitlab_token, gitlab_url, project_id, title, body)
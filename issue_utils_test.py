@@ -74,5 +74,131 @@ class CreateGithubIssueTests(unittest.TestCase):
                     self.assertIn("main", body)
 
 
+class DigestIssueTests(unittest.TestCase):
+    """Tests for the single-issue digest of failed runs."""
+
+    RUN_DETAILS = {
+        "status": "failed",
+        "user_friendly_error": "Button | not found",
+        "failing_step_index": 1,
+        "steps": [{"action_name": "Click", "success": False}],
+        "test_case_id": "test-case-id",
+    }
+
+    def test_digest_body_has_table_row_and_details_per_run(self):
+        """Renders one table row and one collapsed step list per failed run."""
+        body = issue_utils.build_digest_body(
+            runs=[("run-1", self.RUN_DETAILS), ("run-2", self.RUN_DETAILS)],
+            commit_sha="abc1234",
+            branch="main",
+            workflow_url="https://github.com/org/repo/actions/runs/999",
+        )
+        self.assertIn("**Failed journeys:** 2", body)
+        self.assertIn("[`run-1`]", body)
+        self.assertIn("| 2 | Button \\| not found |", body)
+        self.assertEqual(body.count("<details>"), 2)
+        self.assertIn("1. **Click** - ❌ Failed", body)
+
+    def test_digest_body_keeps_runs_of_previous_body(self):
+        """Merges the runs already listed in the issue with the runs reported now."""
+        previous_body = issue_utils.build_digest_body(
+            runs=[("run-1", self.RUN_DETAILS), ("run-2", self.RUN_DETAILS)],
+            commit_sha="abc1234",
+            branch="main",
+            workflow_url="",
+        )
+        body = issue_utils.build_digest_body(
+            runs=[("run-2", {**self.RUN_DETAILS, "user_friendly_error": "Timeout"}),
+                  ("run-3", self.RUN_DETAILS)],
+            commit_sha="abc1234",
+            branch="main",
+            workflow_url="",
+            previous_body=previous_body,
+        )
+        self.assertIn("**Failed journeys:** 3", body)
+        self.assertEqual(body.count("[`run-2`]"), 1)
+        self.assertIn("| 2 | Timeout |", body)
+        self.assertEqual(body.count("<details>"), 3)
+        self.assertLess(body.index("[`run-1`]"), body.index("[`run-3`]"))
+
+    def test_github_digest_fetches_each_run_and_posts_once(self):
+        """Fetches every failed run and posts a single issue keyed by run, job, step and suite."""
+        session = requests.Session()
+        env = {
+            "GITHUB_TOKEN": "tok",
+            "GITHUB_REPOSITORY": "org/repo",
+            "GITHUB_RUN_ID": "999",
+            "GITHUB_JOB": "e2e",
+            "GITHUB_ACTION": "checkout-suite",
+            "INPUT_TEST_SUITE_ID": "suite-id",
+        }
+        with patch.dict(os.environ, env, clear=True):
+            with patch.object(issue_utils, "fetch_run_details",
+                              return_value=self.RUN_DETAILS) as mock_fetch:
+                with patch.object(issue_utils, "_find_github_issue", return_value={}):
+                    with patch.object(issue_utils, "_post_github_issue") as mock_post:
+                        issue_utils.create_github_digest_issue(session, ["run-1", "run-2"])
+        self.assertEqual(mock_fetch.call_count, 2)
+        mock_post.assert_called_once()
+        title, body = mock_post.call_args[0][2], mock_post.call_args[0][3]
+        self.assertTrue(title.endswith("run 999 / e2e / checkout-suite / suite-id"))
+        self.assertIn("run-1", body)
+        self.assertIn("run-2", body)
+
+    def test_github_digest_updates_existing_issue_with_merged_body(self):
+        """Patches the open issue with a matching title and keeps the runs it already lists."""
+        class FakeResponse:
+            """Fake GitHub API response."""
+            def __init__(self, status_code, payload):
+                self.status_code = status_code
+                self.payload = payload
+                self.text = ""
+
+            def json(self):
+                """Return the JSON payload."""
+                return self.payload
+
+        title = "Test Failures: Critical Journey run 999 / e2e"
+        previous_body = issue_utils.build_digest_body(
+            [("run-0", self.RUN_DETAILS)], commit_sha="", branch="", workflow_url="")
+        existing = {"items": [
+            {"number": 8, "title": f"{title} / other", "body": ""},
+            {"number": 7, "title": title, "body": previous_body}]}
+        env = {
+            "GITHUB_TOKEN": "tok",
+            "GITHUB_REPOSITORY": "org/repo",
+            "GITHUB_RUN_ID": "999",
+            "GITHUB_JOB": "e2e",
+        }
+        with patch.dict(os.environ, env, clear=True):
+            with patch.object(issue_utils, "fetch_run_details", return_value=self.RUN_DETAILS):
+                with patch.object(issue_utils.requests, "get",
+                                  return_value=FakeResponse(200, existing)) as mock_get:
+                    with patch.object(issue_utils.requests, "patch",
+                                      return_value=FakeResponse(200, {})) as mock_patch:
+                        with patch.object(issue_utils, "_post_github_issue") as mock_post:
+                            issue_utils.create_github_digest_issue(requests.Session(), ["run-1"])
+        mock_post.assert_not_called()
+        self.assertTrue(mock_patch.call_args[0][0].endswith("/issues/7"))
+        self.assertIn(f'in:title "{title}"', mock_get.call_args[1]["params"]["q"])
+        body = mock_patch.call_args[1]["json"]["body"]
+        self.assertIn("[`run-0`]", body)
+        self.assertIn("[`run-1`]", body)
+
+    def test_failed_search_does_not_create_duplicate(self):
+        """A rate limited or rejected search skips the digest instead of posting a new issue."""
+        search_response = requests.Response()
+        search_response.status_code = 403
+        env = {"GITHUB_TOKEN": "tok", "GITHUB_REPOSITORY": "org/repo", "GITHUB_RUN_ID": "999"}
+        with patch.dict(os.environ, env, clear=True):
+            with patch.object(issue_utils.requests, "get", return_value=search_response):
+                with patch.object(issue_utils, "fetch_run_details") as mock_fetch:
+                    with patch.object(issue_utils, "_post_github_issue") as mock_post:
+                        with patch("builtins.print"):
+                            issue_utils.create_github_digest_issue(requests.Session(), ["run-1"])
+        mock_fetch.assert_not_called()
+        mock_post.assert_not_called()
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,194 @@
+"""Optional profiling of the action, enabled with the `profile` input or CJ_PROFILE=true.
+
+When enabled, the action writes to the profile directory:
+    - cj-profile.pstats: cProfile statistics of all threads (CPU time per function).
+    - cj-profile.collapsed: sampled stacks of all threads in the collapsed format read by
+      flamegraph.pl and speedscope. Samples are wall-clock, so time spent waiting on the
+      network or in `time.sleep` shows up next to CPU work.
+    - cj-profile-summary.txt: wall vs CPU time per phase (settings, login, start, wait, issues
+      and render) and the peak traced memory of the whole run.
+"""
+import contextlib
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+SAMPLE_EVERY_SECONDS = 0.005
+# Since Python 3.12 one cProfile profiler sees every thread; before, only the thread enabling it.
+PROFILER_SEES_ALL_THREADS = sys.version_info >= (3, 12)
+
+# The profiler started by the entry point, if any, so other modules can record phases.
+_active_profiler: "Profiler | None" = None
+
+
+def is_enabled() -> bool:
+    """Returns whether profiling was requested through the action input or environment."""
+    return (os.getenv("INPUT_PROFILE", "false").lower() == "true" or
+            os.getenv("CJ_PROFILE", "false").lower() == "true")
+
+
+def default_output_dir() -> str:
+    """Returns the directory for profile files, inside the workspace so it can be uploaded."""
+    output_dir = os.getenv("INPUT_PROFILE_DIR", "")
+    if output_dir:
+        return output_dir
+    workspace = os.getenv("GITHUB_WORKSPACE") or os.getenv("CI_PROJECT_DIR") or "."
+    return os.path.join(workspace, "cj-profile")
+
+
+def phase(name: str):
+    """Records a phase on the running profiler. Does nothing when profiling is disabled."""
+    if _active_profiler is None:
+        return contextlib.nullcontext()
+    return _active_profiler.phase(name)
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples the stacks of all other threads at a fixed interval."""
+
+    def __init__(self, interval_seconds: float = SAMPLE_EVERY_SECONDS):
+        self._interval_seconds = interval_seconds
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self.samples: Counter[str] = Counter()
+
+    def start(self) -> None:
+        """Starts sampling."""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops sampling."""
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stopped.wait(self._interval_seconds):
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()  # pylint: disable=protected-access
+            for thread_id, frame in frames.items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                stack.append(thread_names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        """Returns the samples in the collapsed stack format, one `stack count` per line."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class Profiler:
+    """Collects CPU, memory and per phase wall/CPU timings of the action."""
+
+    def __init__(self, output_dir: str, enabled: bool = True):
+        self.output_dir = output_dir
+        self.enabled = enabled
+        self.phases: list[tuple[str, float, float]] = []
+        self._profile = cProfile.Profile()
+        self._thread_profiles: list[cProfile.Profile] = []
+        self._lock = threading.Lock()
+        self._sampler = StackSampler()
+
+    @classmethod
+    def from_env(cls) -> "Profiler":
+        """Creates a profiler that is only enabled if profiling was requested."""
+        return cls(default_output_dir(), enabled=is_enabled())
+
+    def start(self) -> None:
+        """Starts collecting."""
+        if not self.enabled:
+            return
+        global _active_profiler  # pylint: disable=global-statement
+        tracemalloc.start()
+        self._sampler.start()
+        if not PROFILER_SEES_ALL_THREADS:
+            threading.setprofile(self._profile_new_thread)
+        self._profile.enable()
+        _active_profiler = self
+
+    def _profile_new_thread(self, frame, event, arg) -> None:
+        """Runs once in each thread started while profiling and enables a profiler for it."""
+        del frame, event, arg
+        profile = cProfile.Profile()
+        with self._lock:
+            self._thread_profiles.append(profile)
+        profile.enable()
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Records wall time and CPU time of the enclosed block.
+
+        CPU time is process wide, so phases that run concurrently on several threads (matrix
+        cells) each include the CPU time of the others. For the same reason memory is only
+        reported for the whole run."""
+        if not self.enabled:
+            yield
+            return
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            self.phases.append((
+                name,
+                time.perf_counter() - wall_start,
+                time.process_time() - cpu_start,
+            ))
+
+    def stop(self) -> None:
+        """Stops collecting and writes the profile files."""
+        global _active_profiler  # pylint: disable=global-statement
+        if not self.enabled:
+            return
+        _active_profiler = None
+        self._profile.disable()
+        threading.setprofile(None)
+        self._sampler.stop()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        stats = pstats.Stats(self._profile)
+        with self._lock:
+            for profile in self._thread_profiles:
+                stats.add(profile)
+        stats.dump_stats(os.path.join(self.output_dir, "cj-profile.pstats"))
+        with open(os.path.join(self.output_dir, "cj-profile.collapsed"), "w",
+                  encoding="utf-8") as fh:
+            fh.write(self._sampler.collapsed())
+        summary = self.summary(peak_memory)
+        with open(os.path.join(self.output_dir, "cj-profile-summary.txt"), "w",
+                  encoding="utf-8") as fh:
+            fh.write(summary)
+        print(summary)
+        print(f"Profile written to {self.output_dir}")
+
+    def summary(self, peak_memory: int) -> str:
+        """Returns a table of wall vs CPU time per phase and the peak memory of the run. Phases
+        recorded more than once, e.g. once per matrix cell, are summed."""
+        totals: dict[str, list] = {}
+        for name, wall, cpu in self.phases:
+            total = totals.setdefault(name, [0, 0.0, 0.0])
+            total[0] += 1
+            total[1] += wall
+            total[2] += cpu
+        lines = [f"{'phase':<12}{'count':>6}{'wall s':>10}{'cpu s':>10}{'wait s':>10}"]
+        for name, (count, wall, cpu) in totals.items():
+            lines.append(
+                f"{name:<12}{count:>6}{wall:>10.3f}{cpu:>10.3f}{max(wall - cpu, 0.0):>10.3f}")
+        lines.append(f"Peak traced memory: {peak_memory / 1024:.1f} KiB")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,79 @@
+"""Tests for the profiling module."""
+import os
+import pstats
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import profiling
+
+
+def _work_in_thread():
+    """CPU work that only runs in a worker thread."""
+    return sum(i * i for i in range(10000))
+
+
+class ProfilerTests(unittest.TestCase):
+    """Tests for Profiler."""
+
+    def test_writes_profile_files(self):
+        """Writes pstats, collapsed stacks and a per phase summary."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            profiler = profiling.Profiler(output_dir)
+            profiler.start()
+            with profiler.phase("wait"):
+                time.sleep(0.05)
+                worker = threading.Thread(target=_work_in_thread)
+                worker.start()
+                worker.join()
+            with patch("builtins.print"):
+                profiler.stop()
+
+            stats = pstats.Stats(os.path.join(output_dir, "cj-profile.pstats"))
+            self.assertIn(
+                "_work_in_thread", {function for _, _, function in stats.stats})
+            with open(os.path.join(output_dir, "cj-profile.collapsed"), encoding="utf-8") as fh:
+                collapsed = fh.read()
+            self.assertIn("MainThread;", collapsed)
+            self.assertRegex(collapsed.splitlines()[0], r" \d+$")
+            with open(os.path.join(output_dir, "cj-profile-summary.txt"),
+                      encoding="utf-8") as fh:
+                summary = fh.read()
+            self.assertRegex(summary, r"wait\s+1\s+\d+\.\d{3}")
+            self.assertIn("Peak traced memory", summary)
+
+    def test_module_phase_records_on_running_profiler(self):
+        """Phases entered through the module are recorded only while a profiler runs, and
+        repeated phases are summed in the summary."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            with profiling.phase("settings"):
+                pass
+            profiler = profiling.Profiler(output_dir)
+            profiler.start()
+            for _ in range(3):
+                with profiling.phase("start"):
+                    pass
+            with patch("builtins.print"):
+                profiler.stop()
+            with profiling.phase("login"):
+                pass
+        self.assertEqual([name for name, *_ in profiler.phases], ["start"] * 3)
+        self.assertRegex(profiler.summary(0), r"start\s+3\s")
+
+    def test_disabled_profiler_writes_nothing(self):
+        """A disabled profiler only runs the enclosed code."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            with patch.dict(os.environ, {"INPUT_PROFILE_DIR": output_dir}, clear=True):
+                profiler = profiling.Profiler.from_env()
+            self.assertFalse(profiler.enabled)
+            profiler.start()
+            with profiler.phase("run"):
+                pass
+            profiler.stop()
+            self.assertEqual(os.listdir(output_dir), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
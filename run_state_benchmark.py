@@ -0,0 +1,96 @@
+"""Micro-benchmark of per-tick run tracking for large suites.
+
+Compares rebuilding the target runs from every collection response, as the runner used to do,
+with updating a RunStateTable in place. Responses are pre-parsed, so JSON decoding, which both
+approaches pay equally, is not measured.
+
+    python run_state_benchmark.py [--ticks 20]
+"""
+import argparse
+import datetime
+import statistics
+import time
+import tracemalloc
+
+import runner
+
+CREATED_AT = datetime.datetime.fromisoformat("2025-01-01T00:00:00.000Z")
+
+
+def _make_responses(run_count: int, ticks: int) -> list[dict]:
+    """Returns one collection response per tick, with runs finishing over time and as many
+    runs from an older collection run alongside them."""
+    responses = []
+    for tick in range(ticks):
+        finished = run_count * (tick + 1) // ticks
+        linked_runs = [
+            {
+                "_id": f"run-{i}",
+                "status": ("failed" if i % 10 == 0 else "passed") if i < finished else "running",
+                "created_at": "2025-01-01T00:00:00Z",
+                "steps": [{"action_name": "Click", "success": True}] * 5,
+                "error_message": None,
+            }
+            for i in range(run_count)
+        ]
+        linked_runs += [
+            {"_id": f"old-run-{i}", "status": "passed", "created_at": "2024-12-31T00:00:00Z"}
+            for i in range(run_count)
+        ]
+        responses.append({"test_suite_id": "project-id", "linked_runs": linked_runs})
+    return responses
+
+
+def _rebuild_per_tick(run_response: dict) -> tuple[bool, dict]:
+    """The previous approach: filter and count full run dicts on every tick."""
+    target_runs = [
+        run for run in run_response["linked_runs"]
+        if datetime.datetime.fromisoformat(run["created_at"]) == CREATED_AT
+    ]
+    status_counts = {"passed": 0, "failed": 0, "failed_run_ids": []}
+    for target_run in target_runs:
+        if target_run["status"] == "passed":
+            status_counts["passed"] += 1
+        if target_run["status"] == "failed":
+            status_counts["failed"] += 1
+            status_counts["failed_run_ids"].append(target_run["_id"])
+    return status_counts["passed"] + status_counts["failed"] == len(target_runs), status_counts
+
+
+def _measure(update, responses: list[dict]) -> tuple[float, int, int]:
+    """Returns the median seconds and median peak bytes allocated per tick, and the bytes
+    still held after all ticks."""
+    durations = []
+    peaks = []
+    tracemalloc.start()
+    for response in responses:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        update(response)
+        durations.append(time.perf_counter() - start)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return statistics.median(durations), int(statistics.median(peaks)), retained
+
+
+def main() -> None:
+    """Prints per-tick CPU time and memory for 1k and 10k runs."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ticks", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'runs':>6} {'approach':<18}{'ms/tick':>10}{'peak KiB/tick':>16}{'retained KiB':>15}")
+    for run_count in (1_000, 10_000):
+        responses = _make_responses(run_count, args.ticks)
+        for name, update in (
+                ("rebuild per tick", _rebuild_per_tick),
+                ("RunStateTable", runner.RunStateTable("collection-id", CREATED_AT).update)):
+            seconds, peak, retained = _measure(update, responses)
+            print(f"{run_count:>6} {name:<18}{seconds * 1000:>10.2f}{peak / 1024:>16.1f}"
+                  f"{retained / 1024:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
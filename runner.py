@@ -1,12 +1,18 @@
 """This script is the entry point for the Github action."""
+import array
 import datetime
+import itertools
 import json
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from math import ceil
 
 import requests
 
+import profiling
+import schema_validation
+
 BACKEND_URL = "https://cj-backend.foreai.co"
 
 def _get_headers(token: str) -> dict:
@@ -15,11 +21,13 @@ def _get_headers(token: str) -> dict:
         "Content-Type": "application/json"
     }
 
-def _create_run_settings_from_env() -> dict:
-    """Creates run settings from environment variables."""
+def create_run_settings(
+        website_url_override: str = "",
+        params_override: str = "",
+        browser_type_override: str = ""
+    ) -> dict:
+    """Creates run settings from the raw action inputs."""
     run_settings = {}
-    website_url_override = os.getenv("INPUT_WEBSITE_URL_OVERRIDE", "")
-    params_override = os.getenv("INPUT_PARAMS_OVERRIDE", "")
     if website_url_override:
         run_settings["website_url_override"] = website_url_override
     if params_override:
@@ -27,25 +35,87 @@ def _create_run_settings_from_env() -> dict:
             run_settings["parameter_overrides"] = json.loads(params_override)
         except json.JSONDecodeError as e:
             raise ValueError(f"Invalid JSON in params_override: {e}") from e
-    browser_type_override = os.getenv("INPUT_BROWSER_TYPE_OVERRIDE", "")
     if browser_type_override:
         run_settings["browser_type_override"] = browser_type_override.lower()
     return run_settings
 
-def _login_service_account(session: requests.Session, service_account_key: str) -> bool:
-    """Logs in the service account and updates session headers."""
-    session.headers.update(_get_headers(service_account_key))
-    response = session.post(f"{BACKEND_URL}/auth/login_service_account")
+def _create_run_settings_from_env() -> dict:
+    """Creates run settings from environment variables."""
+    return create_run_settings(
+        website_url_override=os.getenv("INPUT_WEBSITE_URL_OVERRIDE", ""),
+        params_override=os.getenv("INPUT_PARAMS_OVERRIDE", ""),
+        browser_type_override=os.getenv("INPUT_BROWSER_TYPE_OVERRIDE", ""),
+    )
 
-    if response.status_code != 200:
-        return False
+def _create_matrix_from_env(run_settings: dict) -> list[tuple[str, dict]]:
+    """Expands the matrix input into (cell label, run settings) pairs.
 
+    The matrix is a JSON object with optional `browsers`, `website_urls` and `params` lists. Each
+    cell of their cross product starts from `run_settings`. Returns an empty list if no matrix
+    was provided."""
+    matrix_input = os.getenv("INPUT_MATRIX", "")
+    if not matrix_input:
+        return []
+    try:
+        matrix = json.loads(matrix_input)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON in matrix: {e}") from e
+    if not isinstance(matrix, dict):
+        raise ValueError("matrix must be a JSON object")
+
+    dimensions = []
+    for key, setting, label in (
+            ("browsers", "browser_type_override", "browser"),
+            ("website_urls", "website_url_override", "url"),
+            ("params", "parameter_overrides", "params")):
+        values = matrix.get(key)
+        if values is None:
+            continue
+        if not isinstance(values, list) or not values:
+            raise ValueError(f"matrix.{key} must be a non-empty list")
+        if setting == "browser_type_override":
+            values = [value.lower() if isinstance(value, str) else value for value in values]
+        dimensions.append([(setting, label, value) for value in values])
+    if not dimensions:
+        raise ValueError("matrix must contain at least one of browsers, website_urls or params")
+
+    cells = []
+    for combination in itertools.product(*dimensions):
+        cell_settings = dict(run_settings)
+        labels = []
+        for setting, label, value in combination:
+            cell_settings[setting] = value
+            labels.append(
+                f"{label}={json.dumps(value, sort_keys=True) if label == 'params' else value}")
+        cells.append((", ".join(labels), cell_settings))
+    return cells
+
+
+def _matrix_concurrency_from_env() -> int:
+    """Returns how many matrix cells may run at once. Raises ValueError if it is invalid."""
     try:
-        jwt_token = response.json()
-        session.headers.update(_get_headers(jwt_token))
-        return True
+        matrix_concurrency = int(os.getenv("INPUT_MATRIX_CONCURRENCY", "4"))
+    except ValueError:
+        matrix_concurrency = 0
+    if not 1 <= matrix_concurrency <= 16:
+        raise ValueError("MATRIX_CONCURRENCY must be an integer between 1 and 16")
+    return matrix_concurrency
+
+
+def login_service_account(session: requests.Session, service_account_key: str) -> bool:
+    """Logs in the service account and sets the session token. The key is only sent with the
+    login request, and the session headers are only touched by one assignment on success, so
+    other threads can keep using the session meanwhile."""
+    response = session.post(
+        f"{BACKEND_URL}/auth/login_service_account", headers=_get_headers(service_account_key))
+
+    try:
+        if response.status_code == 200:
+            session.headers["Authorization"] = _get_headers(response.json())["Authorization"]
+            return True
     except requests.JSONDecodeError:
-        return False
+        pass
+    return False
 
 
 def _poll_for_status(
@@ -73,26 +143,28 @@ def _poll_for_status(
     return None  # Timed out
 
 
-def _handle_single_test_run(
+def start_single_test_run(
         session: requests.Session,
         test_case_id: str,
-        run_settings: dict,
-        max_fetches: int,
-        poll_every_seconds: float
-    ) -> tuple[bool, str, list[str]]:
-    """Handles running a single test case."""
+        run_settings: dict
+    ) -> tuple[str | None, str]:
+    """Creates a test run. Returns the run ID, or None and an error message."""
     json_payload = {}
     if len(run_settings.keys()) > 0:
         json_payload["settings"] = run_settings
     response = session.post(f"{BACKEND_URL}/test-run/{test_case_id}", json=json_payload)
 
     if response.status_code != 201:
-        return False, f"Failed to create test run: {response.json()}", []
+        return None, f"Failed to create test run: {response.json()}"
 
-    test_run_id = response.json()
-    run_status = _poll_for_status(
-        session, f"{BACKEND_URL}/test-run/{test_run_id}", max_fetches, poll_every_seconds)
+    return response.json(), ""
 
+
+def single_test_run_result(
+        test_run_id: str,
+        run_status: dict | None
+    ) -> tuple[bool, str, list[str]]:
+    """Turns the final status of a test run into the action result."""
     if not run_status:
         return False, "Timed out waiting for test result!", []
 
@@ -101,41 +173,151 @@ def _handle_single_test_run(
     return False, run_status["error_message"], [test_run_id]
 
 
-def _get_latest_group_run_statuses(
+def _handle_single_test_run(
+        session: requests.Session,
+        test_case_id: str,
+        run_settings: dict,
+        max_fetches: int,
+        poll_every_seconds: float
+    ) -> tuple[bool, str, list[str]]:
+    """Handles running a single test case."""
+    with profiling.phase("start"):
+        test_run_id, error = start_single_test_run(session, test_case_id, run_settings)
+    if not test_run_id:
+        return False, error, []
+
+    with profiling.phase("wait"):
+        run_status = _poll_for_status(
+            session, f"{BACKEND_URL}/test-run/{test_run_id}", max_fetches, poll_every_seconds)
+
+    return single_test_run_result(test_run_id, run_status)
+
+
+# Compact status codes kept per run by RunStateTable.
+_PENDING, _PASSED, _FAILED = 0, 1, 2
+_STATUS_CODES = {"passed": _PASSED, "failed": _FAILED}
+
+
+class RunStateTable:
+    """Compact state of the runs of one collection run, updated in place on every poll.
+
+    Only the ID and a one byte status code are kept per run, in parallel arrays, and the
+    passed/failed/pending counts are maintained incrementally. Each distinct `created_at`
+    string is parsed once, so a tick costs a couple of dict lookups per linked run."""
+
+    __slots__ = (
+        "collection_id", "created_at", "final_link", "_index", "_run_ids", "_status_codes",
+        "_counts", "_created_at_matches",
+    )
+
+    def __init__(self, collection_id: str, created_at: datetime.datetime):
+        self.collection_id = collection_id
+        self.created_at = created_at
+        self.final_link = None
+        self._index: dict[str, int] = {}
+        self._run_ids: list[str] = []
+        self._status_codes = array.array("b")
+        self._counts = [0, 0, 0]
+        self._created_at_matches: dict[str, bool] = {}
+
+    def __len__(self) -> int:
+        return len(self._run_ids)
+
+    def update(self, run_response: dict) -> tuple[bool, dict]:
+        """Applies a collection response and returns whether the run is finished, together
+        with its status counts. `failed_run_ids` is only filled in once the run is finished."""
+        linked_runs = run_response.get("linked_runs", [])
+
+        if self.final_link is None:
+            project_id = run_response.get("test_suite_id")
+            self.final_link = (
+                f"https://app.foreai.co/collections/{project_id}/{self.collection_id}"
+                f"?created_at={self.created_at.strftime('%Y-%m-%dT%H:%M:%S.%fZ')}"
+            )
+
+        if not linked_runs:
+            raise ValueError("No linked runs found in the response")
+
+        index_of = self._index
+        status_codes = self._status_codes
+        counts = self._counts
+        for run in linked_runs:
+            index = index_of.get(run["_id"])
+            if index is None:
+                if not self._is_target(run["created_at"]):
+                    continue
+                index = len(self._run_ids)
+                index_of[run["_id"]] = index
+                self._run_ids.append(run["_id"])
+                status_codes.append(_PENDING)
+                counts[_PENDING] += 1
+            code = _STATUS_CODES.get(run["status"], _PENDING)
+            previous = status_codes[index]
+            if code != previous:
+                status_codes[index] = code
+                counts[previous] -= 1
+                counts[code] += 1
+
+        if not self._run_ids:
+            raise ValueError("No target run found in the response")
+
+        is_finished = counts[_PENDING] == 0
+        status_counts = {
+            "passed": counts[_PASSED],
+            "failed": counts[_FAILED],
+            # Only needed for the result, so the IDs are not collected while runs are pending.
+            "failed_run_ids": [
+                run_id for run_id, code in zip(self._run_ids, status_codes) if code == _FAILED
+            ] if is_finished else [],
+            "final_link": self.final_link,
+        }
+        return is_finished, status_counts
+
+    def _is_target(self, created_at: str) -> bool:
+        matches = self._created_at_matches.get(created_at)
+        if matches is None:
+            matches = datetime.datetime.fromisoformat(created_at) == self.created_at
+            self._created_at_matches[created_at] = matches
+        return matches
+
+
+def get_latest_group_run_statuses(
         run_response: dict,
         collection_id: str,
-        created_at: str
+        created_at: datetime.datetime
     ) -> tuple[bool, dict]:
-    """Gets the latest group run statuses."""
-    linked_runs = run_response.get("linked_runs", [])
+    """Gets the latest group run statuses from a single response."""
+    return RunStateTable(collection_id, created_at).update(run_response)
 
-    project_id = run_response.get("test_suite_id")
-    final_link = f"https://app.foreai.co/collections/{project_id}/{collection_id}"
-    final_link += f"?created_at={created_at.strftime('%Y-%m-%dT%H:%M:%S.%fZ')}"
 
-    if not linked_runs:
-        raise ValueError("No linked runs found in the response")
+def start_bulk_test_run(
+        session: requests.Session,
+        collection_id: str,
+        run_settings: dict
+    ) -> tuple[datetime.datetime | None, str]:
+    """Starts a run of a whole collection. Returns the run timestamp, or None and an error
+    message."""
+    response = session.post(
+        f"{BACKEND_URL}/test-suites/collection/{collection_id}/run-all",
+        json=run_settings)
+    
+    response_json = response.json()
 
-    target_runs = [
-        run for run in linked_runs
-        if datetime.datetime.fromisoformat(run["created_at"]) == created_at
-    ]
+    if response.status_code != 200:
+        return None, f"Failed to create test suite run: {response_json}"
 
-    if not target_runs:
-        raise ValueError("No target run found in the response")
+    try:
+        return datetime.datetime.fromisoformat(response_json), ""
+    except ValueError:
+        return None, "Invalid timestamp format in response"
 
-    status_counts = {"passed": 0, "failed": 0, "failed_run_ids": [], "final_link": final_link}
-    for target_run in target_runs:
-        if target_run["status"] == "passed":
-            status_counts["passed"] += 1
-        if target_run["status"] == "failed":
-            status_counts["failed"] += 1
-            status_counts["failed_run_ids"].append(target_run["_id"])
 
-    if status_counts["passed"] + status_counts["failed"] != len(target_runs):
-        return False, status_counts
+def bulk_test_run_result(group_status: dict) -> tuple[bool, str, list[str]]:
+    """Turns the final group status of a collection run into the action result."""
+    msg = f"{group_status['passed']} passed, {group_status['failed']} failed."
+    msg += f" See status here: {group_status['final_link']}"
 
-    return True, status_counts
+    return group_status["failed"] == 0, msg, group_status["failed_run_ids"]
 
 
 def _handle_bulk_test_run(
@@ -146,50 +328,68 @@ def _handle_bulk_test_run(
         poll_every_seconds: float
     ) -> tuple[bool, str, list[str]]:
     """Handles running a full test suite collection."""
-    response = session.post(
-        f"{BACKEND_URL}/test-suites/collection/{collection_id}/run-all",
-        json=run_settings)
-    
-    response_json = response.json()
+    with profiling.phase("start"):
+        created_at, error = start_bulk_test_run(session, collection_id, run_settings)
+    if not created_at:
+        return False, error, []
 
-    if response.status_code != 200:
-        return False, f"Failed to create test suite run: {response_json}", []
+    run_states = RunStateTable(collection_id, created_at)
+    with profiling.phase("wait"):
+        for _ in range(max_fetches):
+            response = session.get(
+                f"{BACKEND_URL}/test-suites/collection/{collection_id}")
 
-    try:
-        created_at = datetime.datetime.fromisoformat(response_json)
-    except ValueError:
-        return False, "Invalid timestamp format in response", []
+            if response.status_code != 200:
+                print(response.json())
+                return False, "Error fetching test suite status.", []
 
-    for _ in range(max_fetches):
-        response = session.get(
-            f"{BACKEND_URL}/test-suites/collection/{collection_id}")
+            try:
+                is_finished, group_status = run_states.update(response.json())
 
-        if response.status_code != 200:
-            print(response.json())
-            return False, "Error fetching test suite status.", []
+                if not is_finished:
+                    time.sleep(poll_every_seconds)
+                    continue
 
-        try:
-            run_status_json = response.json()
-            is_finished, group_status = _get_latest_group_run_statuses(
-                run_response=run_status_json,
-                collection_id=collection_id,
-                created_at=created_at,
-            )
+                return bulk_test_run_result(group_status)
 
-            if not is_finished:
+            except requests.JSONDecodeError:
                 time.sleep(poll_every_seconds)
                 continue
 
-            msg = f"{group_status['passed']} passed, {group_status['failed']} failed."
-            msg += f" See status here: {group_status['final_link']}"
-
-            return group_status["failed"] == 0, msg, group_status["failed_run_ids"]
+    return False, "Timed out waiting for test suite result.", []
 
-        except requests.JSONDecodeError:
-            time.sleep(poll_every_seconds)
-            continue
 
-    return False, "Timed out waiting for test suite result.", []
+def _handle_matrix_run(
+        session: requests.Session,
+        test_id: str,
+        collection_id: str,
+        matrix_cells: list[tuple[str, dict]],
+        max_fetches: int,
+        poll_every_seconds: float,
+        max_concurrency: int
+    ) -> tuple[bool, str, list[str]]:
+    """Runs every matrix cell concurrently and reports the results keyed by cell."""
+    def run_cell(cell: tuple[str, dict]) -> tuple[bool, str, list[str]]:
+        _, cell_settings = cell
+        try:
+            if test_id:
+                return _handle_single_test_run(
+                    session, test_id, cell_settings, max_fetches, poll_every_seconds)
+            return _handle_bulk_test_run(
+                session, collection_id, cell_settings, max_fetches, poll_every_seconds)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            return False, f"Failed: {e}", []
+
+    with ThreadPoolExecutor(max_workers=min(max_concurrency, len(matrix_cells))) as executor:
+        results = list(executor.map(run_cell, matrix_cells))
+
+    passed = sum(1 for success, _, _ in results if success)
+    lines = [f"{passed} of {len(results)} matrix cells passed."]
+    failed_run_ids = []
+    for (label, _), (success, msg, cell_failed_run_ids) in zip(matrix_cells, results):
+        lines.append(f"[{label}] {'passed' if success else 'failed'}: {msg}")
+        failed_run_ids.extend(cell_failed_run_ids)
+    return passed == len(results), "\n".join(lines), failed_run_ids
 
 
 def run(session: requests.Session) -> tuple[bool, str, list[str]]:
@@ -218,14 +418,32 @@ def run(session: requests.Session) -> tuple[bool, str, list[str]]:
         return False, "Failed: Service account key should be provided.", []
 
     try:
-        run_settings = _create_run_settings_from_env()
+        with profiling.phase("settings"):
+            run_settings = _create_run_settings_from_env()
+            matrix_cells = _create_matrix_from_env(run_settings)
+            for _, cell_settings in matrix_cells or [("", run_settings)]:
+                schema_validation.validate_run_settings(cell_settings, single_test=bool(test_id))
+            matrix_concurrency = _matrix_concurrency_from_env() if matrix_cells else 1
     except ValueError as e:
         return False, f"Failed: {e}", []
 
     try:
-        if not _login_service_account(session, service_account_key):
+        with profiling.phase("login"):
+            logged_in = login_service_account(session, service_account_key)
+        if not logged_in:
             return False, "Failed to login service account.", []
 
+        if matrix_cells and (test_id or collection_id):
+            return _handle_matrix_run(
+                session=session,
+                test_id=test_id,
+                collection_id=collection_id,
+                matrix_cells=matrix_cells,
+                max_fetches=max_fetches,
+                poll_every_seconds=poll_every_seconds,
+                max_concurrency=matrix_concurrency,
+            )
+
         if test_id:
             return _handle_single_test_run(
                 session=session,
@@ -1,10 +1,17 @@
 """Unittest version of tests for the runner module."""
+import datetime
+import json
 import os
+import threading
 import unittest
 from unittest.mock import patch
 
 import requests
+
+import backend_session
 import runner as runner_module
+import schema_validation
+from schema_validation_test import TEST_SPEC, vendor_spec
 
 
 class RunnerTests(unittest.TestCase):
@@ -34,6 +41,31 @@ class RunnerTests(unittest.TestCase):
             self.assertFalse(result)
             self.assertIn("Failed: Invalid JSON in params_override", msg)
 
+    def test_vendored_schemas_match_backend(self):
+        """Test that openapi.json is what `schema_validation.py --update` would vendor now."""
+        vendored_spec = {"components": {"schemas": {}}}
+        if os.path.exists(schema_validation.VENDORED_SPEC_PATH):
+            with open(schema_validation.VENDORED_SPEC_PATH, encoding="utf-8") as fh:
+                vendored_spec = json.load(fh)
+        self.assertEqual(
+            vendored_spec, schema_validation.vendored_subset(self.openapi_spec),
+            "openapi.json is out of date, run `python schema_validation.py --update`")
+
+    def test_invalid_run_settings_fail_before_login(self):
+        """Test that run settings that do not match the schema fail without network calls."""
+        vendor_spec(self, TEST_SPEC)
+        session = requests.Session()
+        with patch.dict(os.environ, {
+            "INPUT_BROWSER_TYPE_OVERRIDE": "edge",
+            "INPUT_SERVICE_ACCOUNT_KEY": "test_key",
+            "INPUT_TEST_SUITE_ID": "collection-id",
+        }, clear=True):
+            with patch.object(session, "post") as mock_post:
+                result, msg, _ = runner_module.run(session)
+                self.assertFalse(result)
+                self.assertIn("Failed: Invalid run settings", msg)
+                mock_post.assert_not_called()
+
     def test_no_login_on_invalid_service_account_key(self):
         """Test that the runner module returns an error when the service account key is invalid."""
         with patch.dict(os.environ, {}, clear=True):
@@ -58,6 +90,24 @@ class RunnerTests(unittest.TestCase):
                 self.assertFalse(result)
                 self.assertEqual(msg, "Failed to login service account.")
 
+    def test_login_sends_key_only_with_login_request(self):
+        """Test that the key never becomes a session header and a failed login keeps the
+        previous token."""
+        session = requests.Session()
+        session.headers["Authorization"] = "Bearer old-token"
+        login_response = requests.Response()
+        login_response.status_code = 200
+        login_response._content = b'"new-token"'  # pylint: disable=protected-access
+        with patch.object(session, "post", return_value=login_response) as mock_post:
+            self.assertTrue(runner_module.login_service_account(session, "test_key"))
+        self.assertEqual(mock_post.call_args.kwargs["headers"]["Authorization"], "Bearer test_key")
+        self.assertEqual(session.headers["Authorization"], "Bearer new-token")
+
+        login_response.status_code = 401
+        with patch.object(session, "post", return_value=login_response):
+            self.assertFalse(runner_module.login_service_account(session, "test_key"))
+        self.assertEqual(session.headers["Authorization"], "Bearer new-token")
+
     def test_handle_single_test_run_success(self):
         """Test that the runner module returns a success message when the single test run is
         successful."""
@@ -223,6 +273,203 @@ class RunnerTests(unittest.TestCase):
                         msg,
                     )
 
+    def test_matrix_run_reports_each_cell(self):
+        """Test that the runner runs the cross product of the matrix and reports every cell."""
+        session = requests.Session()
+        submitted_settings = []
+        lock = threading.Lock()
+
+        class FakeResponse:
+            """Fake response for the login and test run endpoints."""
+            def __init__(self, status_code, payload):
+                self.status_code = status_code
+                self.payload = payload
+
+            def json(self):
+                """Return a JSON response."""
+                return self.payload
+
+        def fake_post(url, json=None, **kwargs):
+            del kwargs
+            if url.endswith("/auth/login_service_account"):
+                return FakeResponse(200, "jwt-token")
+            with lock:
+                submitted_settings.append(json["settings"])
+                run_id = f"{json['settings']['browser_type_override']}-{len(submitted_settings)}"
+            return FakeResponse(201, run_id)
+
+        def fake_get(url, **kwargs):
+            del kwargs
+            if "/test-run/firefox" in url:
+                return FakeResponse(200, {"status": "passed"})
+            return FakeResponse(200, {"status": "failed", "error_message": "Button not found"})
+
+        with patch.dict(os.environ, {
+            "INPUT_SERVICE_ACCOUNT_KEY": "test_key",
+            "INPUT_TEST_ID": "test-case-id",
+            "INPUT_WEBSITE_URL_OVERRIDE": "https://example.com",
+            "INPUT_MATRIX": (
+                '{"browsers": ["chromium", "Firefox"], "params": [{"a": "1"}, {"a": "2"}]}'),
+        }, clear=True):
+            with patch.object(session, "post", side_effect=fake_post):
+                with patch.object(session, "get", side_effect=fake_get):
+                    result, msg, failed_run_ids = runner_module.run(session)
+
+        self.assertFalse(result)
+        self.assertEqual(len(submitted_settings), 4)
+        self.assertTrue(all(
+            settings["website_url_override"] == "https://example.com"
+            for settings in submitted_settings))
+        self.assertIn("2 of 4 matrix cells passed.", msg)
+        self.assertIn('[browser=firefox, params={"a": "2"}] passed: Test passed!', msg)
+        self.assertIn('[browser=chromium, params={"a": "1"}] failed: Button not found', msg)
+        self.assertEqual(len(failed_run_ids), 2)
+
+    def test_suite_matrix_on_shared_backend_session(self):
+        """Test that concurrent suite waits on one collection each report their own runs."""
+        session = backend_session.BackendSession(rate_limits={})
+        created_at = {
+            "chromium": "2025-01-01T00:00:01Z",
+            "firefox": "2025-01-01T00:00:02Z",
+            "webkit": "2025-01-01T00:00:03Z",
+        }
+
+        class FakeResponse:
+            """Fake response of the underlying requests.Session."""
+            headers = {}
+            url = ""
+
+            def __init__(self, status_code, payload):
+                self.status_code = status_code
+                self.payload = payload
+                self.text = json.dumps(payload)
+
+            def json(self):
+                """Return a JSON response."""
+                return self.payload
+
+        def fake_request(self, method, url, *args, json=None, **kwargs):
+            # pylint: disable=redefined-outer-name
+            del self, args, kwargs
+            if url.endswith("/auth/login_service_account"):
+                return FakeResponse(200, "jwt-token")
+            if method == "POST":
+                return FakeResponse(200, created_at[json["browser_type_override"]])
+            return FakeResponse(200, {
+                "test_suite_id": "project-id",
+                "linked_runs": [
+                    {
+                        "_id": f"{browser}-{i}",
+                        "status": "failed" if browser == "webkit" and i == 0 else "passed",
+                        "created_at": timestamp,
+                    }
+                    for browser, timestamp in created_at.items() for i in range(2)
+                ],
+            })
+
+        with patch.dict(os.environ, {
+            "INPUT_SERVICE_ACCOUNT_KEY": "test_key",
+            "INPUT_TEST_SUITE_ID": "collection-id",
+            "INPUT_MATRIX": '{"browsers": ["chromium", "firefox", "webkit"]}',
+            "INPUT_MATRIX_CONCURRENCY": "3",
+        }, clear=True):
+            with patch.object(requests.Session, "request", fake_request):
+                result, msg, failed_run_ids = runner_module.run(session)
+
+        self.assertFalse(result)
+        self.assertIn("2 of 3 matrix cells passed.", msg)
+        self.assertIn("[browser=chromium] passed: 2 passed, 0 failed", msg)
+        self.assertIn("[browser=webkit] failed: 1 passed, 1 failed", msg)
+        self.assertEqual(failed_run_ids, ["webkit-0"])
+
+    def test_matrix_concurrency_is_only_checked_for_matrix_runs(self):
+        """Test that an invalid concurrency fails a matrix run before login and is otherwise
+        ignored."""
+        session = requests.Session()
+        with patch.dict(os.environ, {
+            "INPUT_SERVICE_ACCOUNT_KEY": "test_key",
+            "INPUT_TEST_SUITE_ID": "collection-id",
+            "INPUT_MATRIX_CONCURRENCY": "many",
+        }, clear=True):
+            with patch.object(runner_module, "_handle_bulk_test_run",
+                              return_value=(True, "ok", [])):
+                with patch.object(runner_module, "login_service_account", return_value=True):
+                    self.assertEqual(runner_module.run(session), (True, "ok", []))
+
+            os.environ["INPUT_MATRIX"] = '{"browsers": ["chromium"]}'
+            with patch.object(runner_module, "login_service_account") as mock_login:
+                result, msg, _ = runner_module.run(session)
+                self.assertFalse(result)
+                self.assertEqual(
+                    msg, "Failed: MATRIX_CONCURRENCY must be an integer between 1 and 16")
+                mock_login.assert_not_called()
+
+    def test_matrix_with_invalid_cell_fails_before_login(self):
+        """Test that a matrix cell that does not match the schema fails without network calls."""
+        vendor_spec(self, TEST_SPEC)
+        session = requests.Session()
+        with patch.dict(os.environ, {
+            "INPUT_SERVICE_ACCOUNT_KEY": "test_key",
+            "INPUT_TEST_SUITE_ID": "collection-id",
+            "INPUT_MATRIX": '{"browsers": ["chromium", "edge"]}',
+        }, clear=True):
+            with patch.object(session, "post") as mock_post:
+                result, msg, _ = runner_module.run(session)
+                self.assertFalse(result)
+                self.assertIn("'edge' is not one of", msg)
+                mock_post.assert_not_called()
+
+
+class RunStateTableTests(unittest.TestCase):
+    """Tests for the compact run state table."""
+
+    CREATED_AT = datetime.datetime.fromisoformat("2025-01-01T00:00:00.000Z")
+
+    @staticmethod
+    def _response(statuses):
+        """Builds a collection response with one target run per status and one older run."""
+        linked_runs = [
+            {"_id": f"run-{i}", "status": status, "created_at": "2025-01-01T00:00:00Z"}
+            for i, status in enumerate(statuses)
+        ]
+        linked_runs.append(
+            {"_id": "old-run", "status": "failed", "created_at": "2024-01-01T00:00:00Z"})
+        return {"test_suite_id": "project-id", "linked_runs": linked_runs}
+
+    def test_counts_are_updated_in_place(self):
+        """Status changes between ticks move runs between the counts."""
+        table = runner_module.RunStateTable("collection-id", self.CREATED_AT)
+        is_finished, status = table.update(self._response(["running", "queued", "passed"]))
+        self.assertFalse(is_finished)
+        self.assertEqual((status["passed"], status["failed"]), (1, 0))
+        self.assertEqual(len(table), 3)
+
+        is_finished, status = table.update(self._response(["failed", "running", "passed"]))
+        self.assertFalse(is_finished)
+        self.assertEqual((status["failed"], status["failed_run_ids"]), (1, []))
+
+        is_finished, status = table.update(self._response(["failed", "passed", "passed"]))
+        self.assertTrue(is_finished)
+        self.assertEqual((status["passed"], status["failed"]), (2, 1))
+        self.assertEqual(status["failed_run_ids"], ["run-0"])
+        self.assertEqual(len(table), 3)
+
+    def test_matches_single_response_helper(self):
+        """The table agrees with a fresh get_latest_group_run_statuses on the same response."""
+        response = self._response(["passed", "failed", "running"])
+        table = runner_module.RunStateTable("collection-id", self.CREATED_AT)
+        self.assertEqual(
+            table.update(response),
+            runner_module.get_latest_group_run_statuses(
+                response, "collection-id", self.CREATED_AT),
+        )
+
+    def test_raises_without_target_runs(self):
+        """A response without runs from this collection run is an error."""
+        table = runner_module.RunStateTable("collection-id", self.CREATED_AT)
+        with self.assertRaisesRegex(ValueError, "No target run found"):
+            table.update(self._response([]))
+
 
 if __name__ == "__main__":
     unittest.main()
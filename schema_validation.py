@@ -0,0 +1,269 @@
+"""Local validation of run payloads against the vendored cj-backend OpenAPI schema.
+
+`openapi.json` holds the run payload schemas exactly as the backend publishes them and is only
+written by `--update`. Its component schemas are compiled into plain Python validator functions
+once per process, which takes a few milliseconds. Bad run settings then fail before login or
+any other network call. Without a vendored schema, settings are left to the backend to check.
+
+    python schema_validation.py --update     # re-vendor openapi.json from the backend
+"""
+import argparse
+import functools
+import json
+import os
+import re
+
+VENDORED_SPEC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "openapi.json")
+# Payloads validated locally. `--update` vendors these and the schemas they reference.
+VENDORED_SCHEMAS = ("RunSettings", "SubmitTestRunRequest")
+
+_TYPE_CHECKS = {
+    "string": "isinstance({v}, str)",
+    "integer": "(isinstance({v}, int) and not isinstance({v}, bool))",
+    "number": "(isinstance({v}, (int, float)) and not isinstance({v}, bool))",
+    "boolean": "isinstance({v}, bool)",
+    "object": "isinstance({v}, dict)",
+    "array": "isinstance({v}, list)",
+    "null": "{v} is None",
+}
+
+
+class SchemaValidationError(ValueError):
+    """Raised when a payload does not match its schema."""
+
+
+def _function_name(schema_name: str) -> str:
+    return "_validate_" + re.sub(r"\W", "_", schema_name)
+
+
+def _raise(pad: str, path: str, value: str, message: str) -> str:
+    """Returns a statement raising `<path>: <value> <message>`; value is omitted if empty."""
+    value_expr = f" + repr({value}) + ' '" if value else ""
+    return f"{pad}raise SchemaValidationError({path} + ': '{value_expr} + {message!r})"
+
+
+class _Compiler:
+    """Generates the source of a module with one validator function per component schema."""
+
+    def __init__(self, schemas: dict):
+        self._schemas = schemas
+        self._functions: list[str] = []
+        self._counter = 0
+
+    def compile(self) -> str:
+        """Returns the module source."""
+        for name, schema in self._schemas.items():
+            self._add_function(_function_name(name), schema)
+        validators = ", ".join(
+            f"{json.dumps(name)}: {_function_name(name)}" for name in self._schemas)
+        return "\n\n".join(self._functions) + f"\n\nVALIDATORS = {{{validators}}}\n"
+
+    def _new_var(self) -> str:
+        self._counter += 1
+        return f"v{self._counter}"
+
+    def _add_function(self, name: str, schema: dict) -> str:
+        body = self._statements(schema, "data", "path", 1)
+        self._functions.append(f"def {name}(data, path):\n" + "\n".join(body or ["    pass"]))
+        return name
+
+    def _new_function(self, schema: dict) -> str:
+        self._counter += 1
+        return self._add_function(f"_check_{self._counter}", schema)
+
+    def _statements(self, schema: dict, v: str, path: str, depth: int) -> list[str]:
+        """Returns the statements checking `v`. `path` is an expression naming the value."""
+        pad = "    " * depth
+        if path.isidentifier():
+            return self._checks(schema, v, path, depth)
+        path_var = self._new_var()
+        lines = self._checks(schema, v, path_var, depth)
+        return [f"{pad}{path_var} = {path}"] + lines if lines else []
+
+    def _checks(self, schema: dict, v: str, path: str, depth: int) -> list[str]:
+        # pylint: disable=too-many-branches
+        pad = "    " * depth
+        lines = []
+        if "$ref" in schema:
+            ref_name = schema["$ref"].rsplit("/", 1)[-1]
+            lines.append(f"{pad}{_function_name(ref_name)}({v}, {path})")
+
+        for keyword in ("anyOf", "oneOf"):
+            if keyword not in schema:
+                continue
+            alternatives = [self._new_function(sub) for sub in schema[keyword]]
+            # Errors from a `null` alternative only add noise to the message.
+            reported = [
+                name for name, sub in zip(alternatives, schema[keyword])
+                if sub != {"type": "null"}
+            ] or alternatives
+            lines += [
+                f"{pad}errors = []",
+                f"{pad}for check in ({', '.join(alternatives)},):",
+                f"{pad}    try:",
+                f"{pad}        check({v}, {path})",
+                f"{pad}        break",
+                f"{pad}    except SchemaValidationError as e:",
+                f"{pad}        errors.append((check, e))",
+                f"{pad}else:",
+                f"{pad}    raise SchemaValidationError('; '.join(str(e) for check, e in errors",
+                f"{pad}        if check in ({', '.join(reported)},)))",
+            ]
+
+        for sub in schema.get("allOf", []):
+            lines.append(f"{pad}{self._new_function(sub)}({v}, {path})")
+
+        types = schema.get("type")
+        if isinstance(types, str):
+            types = [types]
+        if types:
+            check = " or ".join(_TYPE_CHECKS[t].format(v=v) for t in types if t in _TYPE_CHECKS)
+            lines += [
+                f"{pad}if not ({check}):",
+                _raise(pad + "    ", path, v, f"is not of type {' or '.join(types)}"),
+            ]
+
+        if "enum" in schema:
+            lines += [
+                f"{pad}if {v} not in {schema['enum']!r}:",
+                _raise(pad + "    ", path, v, f"is not one of {schema['enum']!r}"),
+            ]
+        if "const" in schema:
+            lines += [
+                f"{pad}if {v} != {schema['const']!r}:",
+                _raise(pad + "    ", path, v, f"is not {schema['const']!r}"),
+            ]
+
+        object_lines = self._object_statements(schema, v, path, depth + 1)
+        if object_lines:
+            lines.append(f"{pad}if isinstance({v}, dict):")
+            lines += object_lines
+
+        if "items" in schema:
+            item, index = self._new_var(), self._new_var()
+            lines.append(f"{pad}if isinstance({v}, list):")
+            lines.append(f"{pad}    for {index}, {item} in enumerate({v}):")
+            lines += self._statements(
+                schema["items"], item, f"{path} + '[' + str({index}) + ']'", depth + 2) or [
+                    f"{pad}        pass"]
+
+        for keyword, op, fn in (("minLength", "<", "len"), ("maxLength", ">", "len"),
+                                ("minimum", "<", ""), ("maximum", ">", "")):
+            if keyword in schema:
+                kind = "str" if fn else "(int, float)"
+                lines += [
+                    f"{pad}if isinstance({v}, {kind}) and {fn}({v}) {op} {schema[keyword]!r}:",
+                    _raise(pad + "    ", path, v, f"fails {keyword} {schema[keyword]!r}"),
+                ]
+        return lines
+
+    def _object_statements(self, schema: dict, v: str, path: str, depth: int) -> list[str]:
+        pad = "    " * depth
+        lines = []
+        properties = schema.get("properties", {})
+        for key in schema.get("required", []):
+            lines += [
+                f"{pad}if {key!r} not in {v}:",
+                _raise(pad + "    ", path, "", f"{key!r} is required"),
+            ]
+        for key, sub in properties.items():
+            value = self._new_var()
+            statements = self._statements(sub, value, f"{path} + {('.' + key)!r}", depth + 1)
+            if statements:
+                lines.append(f"{pad}if {key!r} in {v}:")
+                lines.append(f"{pad}    {value} = {v}[{key!r}]")
+                lines += statements
+
+        additional = schema.get("additionalProperties", True)
+        if additional is True:
+            return lines
+        key, value = self._new_var(), self._new_var()
+        lines.append(f"{pad}for {key}, {value} in {v}.items():")
+        lines.append(f"{pad}    if {key} in {tuple(properties)!r}:")
+        lines.append(f"{pad}        continue")
+        if additional is False:
+            lines.append(_raise(pad + "    ", path, key, "is not an allowed key"))
+        else:
+            lines += self._statements(
+                additional, value, f"{path} + '.' + str({key})", depth + 1) or [
+                    f"{pad}    pass"]
+        return lines
+
+
+def compile_schemas(spec: dict) -> str:
+    """Returns Python source defining a validator for each component schema of the spec."""
+    return _Compiler(spec.get("components", {}).get("schemas", {})).compile()
+
+
+@functools.lru_cache(maxsize=None)
+def load_validators(spec_path: str = VENDORED_SPEC_PATH) -> dict:
+    """Returns the validators for the spec, compiled in memory once per process."""
+    with open(spec_path, "rb") as fh:
+        spec = json.load(fh)
+    code = compile(compile_schemas(spec), f"<validators {os.path.basename(spec_path)}>", "exec")
+    namespace = {"SchemaValidationError": SchemaValidationError}
+    exec(code, namespace)  # pylint: disable=exec-used
+    return namespace["VALIDATORS"]
+
+
+def validate(schema_name: str, payload, spec_path: str | None = None) -> None:
+    """Validates the payload against a component schema. Raises SchemaValidationError."""
+    load_validators(spec_path or VENDORED_SPEC_PATH)[schema_name](payload, schema_name)
+
+
+def validate_run_settings(run_settings: dict, single_test: bool) -> None:
+    """Validates run settings as they will be sent to `/test-run` or `run-all`.
+
+    Settings are only checked against schemas vendored from the backend with `--update`. If
+    the schema is not vendored, the backend remains the only judge of the settings."""
+    schema_name = "SubmitTestRunRequest" if single_test else "RunSettings"
+    if not os.path.exists(VENDORED_SPEC_PATH):
+        return
+    if schema_name not in load_validators(VENDORED_SPEC_PATH):
+        return
+    try:
+        if single_test:
+            validate(schema_name, {"settings": run_settings} if run_settings else {})
+        else:
+            validate(schema_name, run_settings)
+    except SchemaValidationError as e:
+        raise SchemaValidationError(f"Invalid run settings: {e}") from e
+
+
+def vendored_subset(spec: dict) -> dict:
+    """Returns the part of a backend spec that is vendored: those of VENDORED_SCHEMAS that the
+    backend defines, and every component schema they reference."""
+    schemas = spec.get("components", {}).get("schemas", {})
+    subset = {}
+    pending = list(VENDORED_SCHEMAS)
+    while pending:
+        name = pending.pop()
+        if name in subset or name not in schemas:
+            continue
+        subset[name] = schemas[name]
+        pending += [
+            ref.rsplit("/", 1)[-1]
+            for ref in re.findall(r'"\$ref": "([^"]+)"', json.dumps(subset[name]))
+        ]
+    return {"components": {"schemas": subset}}
+
+
+def _update_vendored_spec() -> None:
+    import requests  # pylint: disable=import-outside-toplevel
+
+    from runner import BACKEND_URL  # pylint: disable=import-outside-toplevel
+
+    response = requests.get(f"{BACKEND_URL}/openapi.json", timeout=10)
+    response.raise_for_status()
+    with open(VENDORED_SPEC_PATH, "w", encoding="utf-8") as fh:
+        json.dump(vendored_subset(response.json()), fh, indent=2, sort_keys=True)
+        fh.write("\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--update", action="store_true", help="Refresh openapi.json.")
+    args = parser.parse_args()
+    if args.update:
+        _update_vendored_spec()
+        print(f"Vendored {len(load_validators())} schemas into {VENDORED_SPEC_PATH}")
@@ -0,0 +1,134 @@
+"""Tests for the schema_validation module."""
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import schema_validation
+
+
+# Run payload schemas in the shape the backend publishes them; not the backend's own schemas.
+TEST_SPEC = {"components": {"schemas": {
+    "BrowserType": {"enum": ["chromium", "firefox", "webkit"], "type": "string"},
+    "RunSettings": {"type": "object", "properties": {
+        "browser_type_override": {
+            "anyOf": [{"$ref": "#/components/schemas/BrowserType"}, {"type": "null"}]},
+        "parameter_overrides": {"anyOf": [
+            {"type": "object", "additionalProperties": {"type": "string"}}, {"type": "null"}]},
+        "website_url_override": {"anyOf": [{"type": "string"}, {"type": "null"}]},
+    }},
+    "SubmitTestRunRequest": {"type": "object", "properties": {
+        "settings": {"anyOf": [{"$ref": "#/components/schemas/RunSettings"}, {"type": "null"}]},
+    }},
+}}}
+
+
+def vendor_spec(test: unittest.TestCase, spec: dict) -> None:
+    """Vendors the spec for the duration of the test."""
+    tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+    test.addCleanup(tmp_dir.cleanup)
+    spec_path = os.path.join(tmp_dir.name, "openapi.json")
+    with open(spec_path, "w", encoding="utf-8") as fh:
+        json.dump(spec, fh)
+    patcher = patch.object(schema_validation, "VENDORED_SPEC_PATH", spec_path)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    test.addCleanup(schema_validation.load_validators.cache_clear)
+
+
+class CompiledValidatorTests(unittest.TestCase):
+    """Tests for the validators compiled from the vendored schema."""
+
+    def setUp(self):
+        vendor_spec(self, TEST_SPEC)
+
+    def test_accepts_valid_settings(self):
+        """Valid settings pass for both single test and suite payloads."""
+        run_settings = {
+            "website_url_override": "https://example.com",
+            "parameter_overrides": {"foo": "bar"},
+            "browser_type_override": "webkit",
+        }
+        schema_validation.validate_run_settings(run_settings, single_test=True)
+        schema_validation.validate_run_settings(run_settings, single_test=False)
+        schema_validation.validate_run_settings({}, single_test=True)
+
+    def test_rejects_unknown_browser(self):
+        """Browser names outside the schema enum are rejected with the offending path."""
+        with self.assertRaisesRegex(
+                schema_validation.SchemaValidationError,
+                r"Invalid run settings: RunSettings\.browser_type_override: 'edge' is not one of"):
+            schema_validation.validate_run_settings(
+                {"browser_type_override": "edge"}, single_test=False)
+
+    def test_rejects_non_string_params(self):
+        """Parameter override values must be strings."""
+        with self.assertRaisesRegex(
+                schema_validation.SchemaValidationError,
+                r"settings\.parameter_overrides\.count: 3 is not of type string"):
+            schema_validation.validate_run_settings(
+                {"parameter_overrides": {"count": 3}}, single_test=True)
+
+    def test_settings_are_not_checked_without_vendored_schema(self):
+        """Without a vendored spec, or without the payload's schema in it, nothing is rejected."""
+        with patch.object(schema_validation, "VENDORED_SPEC_PATH", "/nonexistent/openapi.json"):
+            schema_validation.validate_run_settings(
+                {"browser_type_override": "edge"}, single_test=False)
+        vendor_spec(self, {"components": {"schemas": {"Other": {"type": "string"}}}})
+        schema_validation.validate_run_settings(
+            {"browser_type_override": "edge"}, single_test=True)
+
+    def test_vendored_subset_follows_refs(self):
+        """Vendors the run schemas the backend defines and the schemas they reference."""
+        spec = {"info": {}, "paths": {}, "components": {"schemas": {
+            **TEST_SPEC["components"]["schemas"], "Unrelated": {"type": "string"}}}}
+        self.assertEqual(schema_validation.vendored_subset(spec), TEST_SPEC)
+        del spec["components"]["schemas"]["SubmitTestRunRequest"]
+        self.assertEqual(
+            set(schema_validation.vendored_subset(spec)["components"]["schemas"]),
+            {"RunSettings", "BrowserType"})
+
+    def test_compiles_nested_schemas(self):
+        """Supports required keys, arrays and closed objects."""
+        spec = {"components": {"schemas": {"Thing": {
+            "type": "object",
+            "required": ["tags"],
+            "properties": {"tags": {"type": "array", "items": {"type": "string"}}},
+            "additionalProperties": False,
+        }}}}
+        namespace = {"SchemaValidationError": schema_validation.SchemaValidationError}
+        exec(schema_validation.compile_schemas(spec), namespace)  # pylint: disable=exec-used
+        validate_thing = namespace["VALIDATORS"]["Thing"]
+        validate_thing({"tags": ["a"]}, "Thing")
+        for payload, error in (
+                ({}, "Thing: 'tags' is required"),
+                ({"tags": ["a", 1]}, r"Thing\.tags\[1\]: 1 is not of type string"),
+                ({"tags": [], "x": 1}, "Thing: 'x' is not an allowed key")):
+            with self.assertRaisesRegex(schema_validation.SchemaValidationError, error):
+                validate_thing(payload, "Thing")
+
+
+class LoadValidatorsTests(unittest.TestCase):
+    """Tests for loading the validators of a spec file."""
+
+    def test_compiles_once_per_process(self):
+        """A second load of the same spec reuses the compiled validators."""
+        spec = {"components": {"schemas": {"Name": {"type": "string"}}}}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            spec_path = os.path.join(tmp_dir, "openapi.json")
+            with open(spec_path, "w", encoding="utf-8") as fh:
+                json.dump(spec, fh)
+            with patch.object(
+                    schema_validation, "compile_schemas",
+                    wraps=schema_validation.compile_schemas) as mock_compile:
+                validators = schema_validation.load_validators(spec_path)
+                self.assertIs(schema_validation.load_validators(spec_path), validators)
+                mock_compile.assert_called_once()
+            schema_validation.load_validators.cache_clear()
+        with self.assertRaises(schema_validation.SchemaValidationError):
+            validators["Name"](1, "Name")
+
+
+if __name__ == "__main__":
+    unittest.main()
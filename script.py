@@ -2,34 +2,56 @@
 import os
 import sys
 
-import requests
-
+import backend_session
 import issue_utils
+import profiling
 import runner
 
 
-with requests.Session() as session:
-    success, output_msg, failed_run_ids = runner.run(session)
+def escape_github_output(value: str) -> str:
+    """Escape special characters for GitHub Actions output."""
+    value = value.replace("%", "%25")
+    value = value.replace("\r", "%0D")
+    value = value.replace("\n", "%0A")
+    return value
 
-    if (not success and failed_run_ids and
-        os.getenv("INPUT_CREATE_ISSUE_ON_FAILURE", "false").lower() == "true"):
-        is_github = bool(os.getenv("GITHUB_TOKEN"))
-        is_gitlab = bool(os.getenv("INPUT_GITLAB_TOKEN"))
+
+def create_issues(session: backend_session.BackendSession, failed_run_ids: list[str]) -> None:
+    """Reports failed runs as GitHub or GitLab issues, in one digest issue if requested."""
+    is_github = bool(os.getenv("GITHUB_TOKEN"))
+    is_gitlab = bool(os.getenv("INPUT_GITLAB_TOKEN"))
+    if not is_github and not is_gitlab:
+        print("Warning: No token found for issue creation; cannot create issue.")
+    elif os.getenv("INPUT_ISSUE_DIGEST", "false").lower() == "true":
+        if is_github:
+            issue_utils.create_github_digest_issue(session, failed_run_ids)
+        else:
+            issue_utils.create_gitlab_digest_issue(session, failed_run_ids)
+    else:
         for failed_run_id in failed_run_ids:
             if is_github:
                 issue_utils.create_github_issue_for_run(session, failed_run_id)
-            elif is_gitlab:
-                issue_utils.create_gitlab_issue_for_run(session, failed_run_id)
             else:
-                print("Warning: No token found for issue creation; cannot create issue.")
+                issue_utils.create_gitlab_issue_for_run(session, failed_run_id)
 
 
-def escape_github_output(value: str) -> str:
-    """Escape special characters for GitHub Actions output."""
-    value = value.replace("%", "%25")
-    value = value.replace("\r", "%0D")
-    value = value.replace("\n", "%0A")
-    return value
+profiler = profiling.Profiler.from_env()
+profiler.start()
+try:
+    try:
+        session = backend_session.BackendSession()
+    except ValueError as e:  # Invalid CJ_RATE_LIMITS.
+        success, output_msg, failed_run_ids = False, f"Failed: {e}", []
+    else:
+        with session:
+            success, output_msg, failed_run_ids = runner.run(session)
+
+            if (not success and failed_run_ids and
+                os.getenv("INPUT_CREATE_ISSUE_ON_FAILURE", "false").lower() == "true"):
+                with profiling.phase("issues"):
+                    create_issues(session, failed_run_ids)
+finally:
+    profiler.stop()
 
 # Set the output - even for failures.
 github_output = os.getenv("GITHUB_OUTPUT")